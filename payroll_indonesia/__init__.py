@@ -14,3 +14,15 @@ def _patch_salary_slip_globals():
             except Exception as e:
                 frappe.log_error(f"Failed loading salary_slip_globals {key}: {e}")
     return globals_dict
+
+
+# Resolved salary_slip_globals per site; hooks only change on deploy/restart
+_SALARY_SLIP_GLOBALS = {}
+
+def get_salary_slip_globals():
+    """Return _patch_salary_slip_globals() resolved once per site per process."""
+    site = getattr(getattr(frappe, "local", None), "site", None)
+    globals_dict = _SALARY_SLIP_GLOBALS.get(site)
+    if globals_dict is None:
+        globals_dict = _SALARY_SLIP_GLOBALS[site] = _patch_salary_slip_globals()
+    return globals_dict
@@ -1,9 +1,14 @@
 from .config import (
+    clear_ptkp_cache,
+    clear_ter_rate_cache,
     get_bpjs_cap,
     get_bpjs_rate,
+    get_cached_value,
+    get_employee_field,
     get_ptkp_amount,
     get_settings,
     get_ter_code,
+    get_ter_code_and_rate,
     get_ter_rate,
     get_value,
     get_biaya_jabatan_rate,
@@ -12,12 +17,17 @@ from .config import (
 )
 
 __all__ = [
+    "clear_ptkp_cache",
+    "clear_ter_rate_cache",
     "get_settings",
     "get_value",
+    "get_cached_value",
+    "get_employee_field",
     "get_bpjs_rate",
     "get_bpjs_cap",
     "get_ptkp_amount",
     "get_ter_code",
+    "get_ter_code_and_rate",
     "get_ter_rate",
     "get_biaya_jabatan_rate",
     "get_biaya_jabatan_cap_yearly",
@@ -21,6 +21,12 @@ DEFAULTS = {
     "BPJS_JKM_COMPANY": 0.3,                  # percent
 }
 
+# Site cache hash holding (ter_code, brackets) per tax_status
+TER_RATE_CACHE_KEY = "payroll_indonesia:ter_rate_table"
+
+# Site cache hash holding the PTKP Table row per tax_status
+PTKP_CACHE_KEY = "payroll_indonesia:ptkp_table"
+
 # Logger for consistent logging
 logger = frappe.logger("payroll_indonesia.config")
 
@@ -61,6 +67,17 @@ def get_value(fieldname: str, default=None):
     """
     return get_settings().get(fieldname, default)
 
+def get_cached_value(fieldname: str, default=None):
+    """
+    Fetch a single field from Payroll Indonesia Settings via the request-level
+    singles cache, without loading the whole settings document.
+    """
+    try:
+        value = frappe.db.get_single_value(DEFAULTS["SETTINGS_DOCTYPE"], fieldname, cache=True)
+    except Exception:
+        value = None
+    return default if value is None or value == "" else value
+
 def get_numeric(fieldname: str, default_key: str = None) -> float:
     """
     Helper to fetch a numeric value from settings with proper fallback and logging.
@@ -110,33 +127,53 @@ def get_ptkp_amount_from_tax_status(tax_status: str) -> float:
         logger.error("PTKP amount lookup: tax_status is empty.")
         raise ValidationError("PTKP amount lookup: tax_status is empty.")
         
-    if not frappe.db.exists("PTKP Table", {"tax_status": tax_status}):
+    # A single lookup doubles as the existence check; kept in the site cache
+    # until clear_ptkp_cache is called
+    row = frappe.cache().hget(
+        PTKP_CACHE_KEY, tax_status, generator=lambda: _load_ptkp_row(tax_status)
+    )
+    
+    if not row:
         logger.error(f"PTKP Table: tax_status '{tax_status}' not found.")
         raise ValidationError(f"PTKP Table: tax_status '{tax_status}' not found.")
         
+    if row.get("ptkp_amount") is not None:
+        return flt(row["ptkp_amount"])
+        
+    logger.warning(f"PTKP Table: No ptkp_amount found for tax_status '{tax_status}'.")
+    return 0.0
+
+def _load_ptkp_row(tax_status: str) -> dict | None:
+    """
+    Read the PTKP Table row of tax_status as a plain dict for the site cache.
+    """
     row = frappe.get_value(
         "PTKP Table",
         {"tax_status": tax_status},
         ["ptkp_amount"],
         as_dict=True,
     )
-    
-    if row and row.get("ptkp_amount") is not None:
-        return flt(row["ptkp_amount"])
-        
-    logger.warning(f"PTKP Table: No ptkp_amount found for tax_status '{tax_status}'.")
-    return 0.0
+    return dict(row) if row else None
+
+def clear_ptkp_cache() -> None:
+    """
+    Drop cached PTKP amounts after the PTKP Table changes.
+    """
+    frappe.cache().delete_value(PTKP_CACHE_KEY)
+
+def get_employee_field(employee_doc, fieldname: str):
+    """
+    Read fieldname from an Employee dict or document; None when absent.
+    """
+    if isinstance(employee_doc, dict):
+        return employee_doc.get(fieldname)
+    return getattr(employee_doc, fieldname, None)
 
 def get_ptkp_amount(employee_doc) -> float:
     """
     Return PTKP amount for employee_doc using field tax_status.
     """
-    if hasattr(employee_doc, "tax_status"):
-        tax_status = getattr(employee_doc, "tax_status")
-    elif isinstance(employee_doc, dict):
-        tax_status = employee_doc.get("tax_status")
-    else:
-        tax_status = None
+    tax_status = get_employee_field(employee_doc, "tax_status")
 
     return get_ptkp_amount_from_tax_status(tax_status)
 
@@ -145,21 +182,13 @@ def get_ter_code(employee_doc) -> str | None:
     Get TER code for employee from TER Mapping Table based on tax_status.
     Returns None if not found.
     """
-    if hasattr(employee_doc, "tax_status"):
-        tax_status = getattr(employee_doc, "tax_status")
-    elif isinstance(employee_doc, dict):
-        tax_status = employee_doc.get("tax_status")
-    else:
-        tax_status = None
+    tax_status = get_employee_field(employee_doc, "tax_status")
         
     if not tax_status:
         logger.warning("TER code lookup: Employee tax_status is empty.")
         return None
         
-    if not frappe.db.exists("TER Mapping Table", {"tax_status": tax_status}):
-        logger.warning(f"TER Mapping Table: tax_status '{tax_status}' not found.")
-        return None
-        
+    # A single lookup doubles as the existence check
     row = frappe.get_value(
         "TER Mapping Table",
         {"tax_status": tax_status},
@@ -167,28 +196,21 @@ def get_ter_code(employee_doc) -> str | None:
         as_dict=True,
     )
     
-    if row and "ter_code" in row:
+    if not row:
+        logger.warning(f"TER Mapping Table: tax_status '{tax_status}' not found.")
+        return None
+        
+    if "ter_code" in row:
         return row["ter_code"]
         
     logger.warning(f"TER Mapping Table: No ter_code found for tax_status '{tax_status}'.")
     return None
 
-def get_ter_rate(ter_code: str, monthly_income: float) -> float:
+def _match_ter_bracket(ter_code: str, brackets, monthly_income: float) -> float:
     """
-    Get TER rate from TER Bracket Table for given ter_code and monthly_income.
-    Returns rate_percent (float), 0.0 if not found.
+    Return rate_percent of the bracket containing monthly_income.
+    Raises ValidationError when there are no brackets or none match.
     """
-    if not ter_code:
-        logger.warning("TER rate lookup: ter_code is empty.")
-        return 0.0
-        
-    brackets = frappe.get_all(
-        "TER Bracket Table",
-        filters={"ter_code": ter_code},
-        fields=["min_income", "max_income", "rate_percent"],
-        order_by="min_income asc",
-    )
-    
     if not brackets:
         error_msg = f"TER Bracket Table: No brackets found for ter_code '{ter_code}'."
         logger.error(error_msg)
@@ -205,6 +227,91 @@ def get_ter_rate(ter_code: str, monthly_income: float) -> float:
     error_msg = f"TER Bracket Table: No bracket match for ter_code '{ter_code}' and monthly_income {monthly_income}."
     logger.error(error_msg)
     raise ValidationError(error_msg)
+
+def get_ter_rate(ter_code: str, monthly_income: float) -> float:
+    """
+    Get TER rate from TER Bracket Table for given ter_code and monthly_income.
+    Returns rate_percent (float), 0.0 if not found.
+    """
+    if not ter_code:
+        logger.warning("TER rate lookup: ter_code is empty.")
+        return 0.0
+        
+    brackets = frappe.get_all(
+        "TER Bracket Table",
+        filters={"ter_code": ter_code},
+        fields=["min_income", "max_income", "rate_percent"],
+        order_by="min_income asc",
+    )
+    return _match_ter_bracket(ter_code, brackets, monthly_income)
+
+def get_ter_code_and_rate(employee_doc, monthly_income: float) -> tuple:
+    """
+    Resolve TER code and rate for employee_doc in one round trip.
+
+    Joins TER Mapping Table to TER Bracket Table on ter_code instead of
+    looking up the code and then its brackets with two serial queries.
+    The result per tax_status is kept in the site cache until
+    clear_ter_rate_cache is called.
+    Returns (ter_code, rate_percent); (None, 0.0) when tax_status is unmapped.
+    Raises ValidationError like get_ter_rate when no bracket applies.
+    """
+    tax_status = get_employee_field(employee_doc, "tax_status")
+
+    if not tax_status:
+        logger.warning("TER code lookup: Employee tax_status is empty.")
+        return None, 0.0
+
+    ter_code, brackets = frappe.cache().hget(
+        TER_RATE_CACHE_KEY, tax_status, generator=lambda: _load_ter_table(tax_status)
+    )
+
+    if not ter_code:
+        logger.warning(f"TER Mapping Table: tax_status '{tax_status}' not found.")
+        return None, 0.0
+
+    return ter_code, _match_ter_bracket(ter_code, brackets, monthly_income)
+
+def _load_ter_table(tax_status: str) -> tuple:
+    """
+    Read TER code and its brackets for tax_status as plain, picklable data.
+
+    If tax_status is mapped more than once, only the brackets of the first
+    mapping row are used, like the separate code and bracket lookups.
+    """
+    rows = frappe.db.sql(
+        """
+        SELECT m.name AS mapping, m.ter_code, b.name AS bracket, b.min_income, b.max_income, b.rate_percent
+        FROM `tabTER Mapping Table` m
+        LEFT JOIN `tabTER Bracket Table` b ON b.ter_code = m.ter_code
+        WHERE m.tax_status = %s
+        ORDER BY m.idx ASC, b.min_income ASC
+        """,
+        (tax_status,),
+        as_dict=True,
+    )
+    if not rows or not rows[0].get("ter_code"):
+        return None, []
+
+    ter_code, mapping = rows[0]["ter_code"], rows[0]["mapping"]
+    # LEFT JOIN yields a single row with NULL bracket columns when none exist;
+    # a NULL rate on an existing bracket counts as 0%
+    brackets = [
+        {
+            "min_income": flt(row.get("min_income")),
+            "max_income": flt(row.get("max_income")),
+            "rate_percent": flt(row.get("rate_percent")),
+        }
+        for row in rows
+        if row.get("mapping") == mapping and row.get("bracket")
+    ]
+    return ter_code, brackets
+
+def clear_ter_rate_cache() -> None:
+    """
+    Drop cached TER codes and brackets after the TER tables change.
+    """
+    frappe.cache().delete_value(TER_RATE_CACHE_KEY)
     
 def get_biaya_jabatan_rate() -> float:
     """
@@ -101,16 +101,17 @@ def calculate_pkp_annual(netto_total, ptkp_annual):
     pkp = max(netto_total - ptkp_annual, 0)
     return int(round(pkp / 1000.0)) * 1000
 
-def calculate_pph21_progressive(pkp_annual):
+def calculate_pph21_progressive(pkp_annual, slabs=None):
     """
     Hitung PPh 21 setahun dengan metode progresif (slab).
+    slabs: hasil get_tax_slabs() bila sudah dibaca oleh pemanggil
     Return: total pph setahun
     """
     pajak = 0
     pkp_left = pkp_annual
     lower_limit = 0
 
-    for batas, rate in get_tax_slabs():
+    for batas, rate in (slabs if slabs is not None else get_tax_slabs()):
         if pkp_left <= 0:
             break
         lapisan = min(pkp_left, batas - lower_limit)
@@ -144,11 +145,7 @@ def calculate_pph21_progressive_year(employee, salary_slips, pph21_paid_jan_nov=
             'employment_type_checked': bool
         }
     """
-    employment_type = None
-    if hasattr(employee, "employment_type"):
-        employment_type = getattr(employee, "employment_type")
-    elif isinstance(employee, dict):
-        employment_type = employee.get("employment_type")
+    employment_type = config.get_employee_field(employee, "employment_type")
 
     if employment_type != "Full-time":
         return {
@@ -167,7 +164,7 @@ def calculate_pph21_progressive_year(employee, salary_slips, pph21_paid_jan_nov=
         }
 
     # 1. PTKP tahunan
-    tax_status = getattr(employee, "tax_status", None) if hasattr(employee, "tax_status") else employee.get("tax_status")
+    tax_status = config.get_employee_field(employee, "tax_status")
     ptkp_annual = get_ptkp_amount(tax_status)
 
     # 2. Jumlah slip gaji tahun berjalan (Jan–Des)
@@ -190,13 +187,14 @@ def calculate_pph21_progressive_year(employee, salary_slips, pph21_paid_jan_nov=
     pkp_annual = calculate_pkp_annual(netto_total, ptkp_annual)
 
     # 4. Hitung PPh progresif setahun
-    pph21_annual = calculate_pph21_progressive(pkp_annual)
+    slabs = get_tax_slabs()
+    pph21_annual = calculate_pph21_progressive(pkp_annual, slabs)
     # 5. Pajak bulan Desember/final
     koreksi_pph21 = pph21_annual - pph21_paid_jan_nov
     pph21_bulan = koreksi_pph21
 
     # 6. Rate info (for audit only)
-    rates = "/".join([f"{rate}%" for _, rate in get_tax_slabs()])
+    rates = "/".join([f"{rate}%" for _, rate in slabs])
 
     return {
         "bruto_total": bruto_total,
@@ -8,6 +8,8 @@ IMPORTANT: This module only handles monthly TER calculations.
            December/annual calculations must use pph21_ter_december.py
 """
 
+from datetime import datetime
+
 import frappe
 from frappe import ValidationError
 from frappe.utils import flt
@@ -15,9 +17,9 @@ from typing import Dict, Any, Optional, Union, List
 
 # Prevent circular imports - only import config constants
 from payroll_indonesia.config import (
+    get_employee_field,
     get_ptkp_amount,
-    get_ter_code,
-    get_ter_rate,
+    get_ter_code_and_rate,
     get_biaya_jabatan_rate,
     get_biaya_jabatan_cap_monthly,
 )
@@ -73,18 +75,11 @@ def calculate_pph21_TER(taxable_income: Union[float, Dict[str, Any]],
 
     # Ensure bulan is valid or use default
     if not bulan:
-        # Try to get bulan from employee data
-        if hasattr(employee, "bulan"):
-            bulan = getattr(employee, "bulan")
-        elif isinstance(employee, dict) and employee.get("bulan"):
-            bulan = employee.get("bulan")
-        else:
-            # Default ke bulan berjalan jika tidak diberikan
-            from datetime import datetime
-            bulan = datetime.now().month
+        # Try to get bulan from employee data, default ke bulan berjalan
+        bulan = get_employee_field(employee, "bulan") or datetime.now().month
     
     # Employment type check - only process Full-time employees
-    emp_type = employee.get("employment_type") if isinstance(employee, dict) else getattr(employee, "employment_type", None)
+    emp_type = get_employee_field(employee, "employment_type")
     if emp_type != "Full-time":
         return {"employment_type_checked": False, "pph21": 0.0}
     
@@ -124,9 +119,8 @@ def calculate_pph21_TER(taxable_income: Union[float, Dict[str, Any]],
     pkp = max(netto - ptkp, 0)
     
     # Get TER rate based on employee code and bruto
-    ter_code = get_ter_code(employee)
     try:
-        rate = get_ter_rate(ter_code, bruto)
+        _, rate = get_ter_code_and_rate(employee, bruto)
     except ValidationError as e:
         frappe.logger().warning(str(e))
         rate = 0.0
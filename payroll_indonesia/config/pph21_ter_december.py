@@ -15,7 +15,7 @@ from frappe import ValidationError
 from frappe.utils import flt, getdate
 from decimal import Decimal, ROUND_HALF_UP
 
-from payroll_indonesia.config import get_ptkp_amount, config
+from payroll_indonesia.config import get_employee_field, get_ptkp_amount, config
 
 DEFAULT_TAX_SLABS = [
     (60_000_000, 5),
@@ -25,6 +25,16 @@ DEFAULT_TAX_SLABS = [
     (float("inf"), 35),
 ]
 
+
+def format_slab_rates(slabs: List[Tuple[float, float]]) -> str:
+    """Label tarif untuk pph21_info, mis. "5%/15%/25%/30%/35%"."""
+    if slabs is DEFAULT_TAX_SLABS:
+        return DEFAULT_RATES_LABEL
+    return "/".join(f"{rate}%" for _, rate in slabs)
+
+
+DEFAULT_RATES_LABEL = "/".join(f"{rate}%" for _, rate in DEFAULT_TAX_SLABS)
+
 # ---------------------------------------------------------------------------
 # HELPERS
 # ---------------------------------------------------------------------------
@@ -121,11 +131,14 @@ def calculate_pkp_annual(netto_total: float, ptkp_annual: float) -> float:
     return floor_to_thousand(pkp)
 
 
-def calculate_pph21_progressive(pkp_annual: float) -> float:
+def calculate_pph21_progressive(
+    pkp_annual: float, slabs: Optional[List[Tuple[float, float]]] = None
+) -> float:
+    """Pajak progresif tahunan; ``slabs`` dibaca dari settings bila tidak diberikan."""
     pajak = 0.0
     pkp_left = flt(pkp_annual)
     lower = 0.0
-    for batas, rate in get_tax_slabs():
+    for batas, rate in (slabs if slabs is not None else get_tax_slabs()):
         if pkp_left <= 0:
             break
         lap = min(pkp_left, batas - lower)
@@ -160,7 +173,7 @@ def calculate_pph21_december(
     if not company:
         frappe.throw("Company is required for PPh21 calculation", title="Missing Company")
 
-    emp_type = employee.get("employment_type") if isinstance(employee, dict) else getattr(employee, "employment_type", None)
+    emp_type = get_employee_field(employee, "employment_type")
     if emp_type != "Full-time":
         return {
             "bruto_total": 0.0, "netto_total": 0.0, "ptkp_annual": 0.0, "pkp_annual": 0.0,
@@ -196,12 +209,13 @@ def calculate_pph21_december(
         ptkp_annual = 0.0
 
     pkp_annual = calculate_pkp_annual(netto_annual, ptkp_annual)
-    pph21_annual = round_rupiah(calculate_pph21_progressive(pkp_annual))
+    slabs = get_tax_slabs()
+    pph21_annual = round_rupiah(calculate_pph21_progressive(pkp_annual, slabs))
 
     koreksi_pph21 = pph21_annual - flt(ytd_tax_paid_jan_nov)
     pph21_bulan_des = koreksi_pph21
 
-    rates = "/".join([f"{rate}%" for _, rate in get_tax_slabs()])
+    rates = format_slab_rates(slabs)
 
     # nilai netto_desember hanya untuk display (bukan dasar tahunan)
     netto_desember = bruto_des - bj_month - flt(pengurang_netto_desember)
@@ -253,8 +267,7 @@ def calculate_pph21_december_from_slips(
     if not salary_slips:
         return {"message": "Daftar salary slip kosong.", "employment_type_checked": True}
 
-    emp_type = employee.get("employment_type") if isinstance(employee, dict) \
-        else getattr(employee, "employment_type", None)
+    emp_type = get_employee_field(employee, "employment_type")
     if emp_type != "Full-time":
         return {
             "bruto_jan_nov": 0.0, "bruto_desember": 0.0, "bruto_total": 0.0,
@@ -298,10 +311,11 @@ def calculate_pph21_december_from_slips(
     except ValidationError:
         ptkp_annual = 0.0
     pkp_annual = calculate_pkp_annual(netto_annual, ptkp_annual)
-    pph21_annual = round_rupiah(calculate_pph21_progressive(pkp_annual))
+    slabs = get_tax_slabs()
+    pph21_annual = round_rupiah(calculate_pph21_progressive(pkp_annual, slabs))
 
     koreksi_pph21 = pph21_annual - pph21_paid_jan_nov
-    rates = "/".join([f"{rate}%" for _, rate in get_tax_slabs()])
+    rates = format_slab_rates(slabs)
 
     # netto_desember (display only)
     netto_desember_display = bruto_desember - bj_month
@@ -125,7 +125,10 @@ salary_slip_globals = {
 
 doc_events = {
     "Salary Structure": {
-        "validate": "payroll_indonesia.utils.validate_salary_structure.validate_salary_structure_required_components"
+        "validate": [
+            "payroll_indonesia.utils.validate_salary_structure.validate_salary_structure_required_components",
+            "payroll_indonesia.utils.validate_salary_structure.precompile_salary_structure_formulas",
+        ]
     },
     "Salary Slip": {
         "on_submit": "payroll_indonesia.override.salary_slip.on_submit",
@@ -9,21 +9,57 @@ except ImportError:
         title="Missing Dependency"
     )
 
+import copy
 import frappe
+import logging
 import traceback
 from typing import Callable, Dict, List, Any, Optional, Tuple
 from payroll_indonesia.override.salary_slip import CustomSalarySlip
-from payroll_indonesia.config import get_value
-from payroll_indonesia.utils.sync_annual_payroll_history import sync_annual_payroll_history
+from payroll_indonesia.config import get_cached_value
+from payroll_indonesia.utils.sync_annual_payroll_history import (
+    deferred_annual_payroll_sync,
+    sync_annual_payroll_history,
+)
 from frappe.utils import file_lock
 import os
 import time
+from contextlib import nullcontext
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 
 # Setup global logger for consistent logging.
 # This logs to logs/payroll_indonesia.log via the site's configured loggers.
 logger = frappe.logger("payroll_indonesia")
 
+# Number of salary slips loaded per batch while recalculating tax
+SLIP_PREFETCH_SIZE = 100
+
+def _log_errors(errors: List[Tuple[str, str]]) -> None:
+    """
+    Write buffered errors to Error Log with a single bulk insert.
+    
+    Args:
+        errors: List of (title, message) tuples collected while processing
+    """
+    if not errors:
+        return
+    try:
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
+        user = frappe.session.user
+        frappe.db.bulk_insert(
+            "Error Log",
+            ["name", "creation", "modified", "owner", "modified_by", "docstatus", "method", "error"],
+            [
+                (frappe.generate_hash(length=10), timestamp, timestamp, user, user, 0, title, message)
+                for title, message in errors
+            ],
+        )
+    except Exception:
+        # Fall back to the regular per-entry insert
+        for title, message in errors:
+            frappe.log_error(message=message, title=title)
+
+
 class CustomPayrollEntry(PayrollEntry):
     """
     Custom Payroll Entry for Payroll Indonesia.
@@ -36,7 +72,7 @@ class CustomPayrollEntry(PayrollEntry):
         if getattr(self, "run_payroll_indonesia", False):
             logger.info("Payroll Entry: Run Payroll Indonesia is checked.")
             if hasattr(self, "pph21_method") and not self.pph21_method:
-                self.pph21_method = get_value("pph21_method", "TER")
+                self.pph21_method = get_cached_value("pph21_method", "TER")
         if getattr(self, "run_payroll_indonesia_december", False):
             logger.info("Payroll Entry: Run Payroll Indonesia DECEMBER mode is checked.")
             # Add December-specific validation if needed
@@ -156,26 +192,14 @@ class CustomPayrollEntry(PayrollEntry):
                 logger.warning(f"No base salary slips created for December mode {self.name}")
                 return []
             
-            # Get Salary Slip doctype metadata once
-            salary_slip_meta = frappe.get_meta("Salary Slip")
-            
             def calculate_december_tax(slip_obj: Any) -> None:
                 """Calculate December (annual progressive) tax for the slip."""
                 # Ensure December tax type is set before validation or calculation
                 setattr(slip_obj, "tax_type", "DECEMBER")
                 
-                # Calculate December (annual progressive) tax
+                # Calculate December (annual progressive) tax.
+                # tax, tax_type and pph21_info are persisted by _process_salary_slips.
                 slip_obj.calculate_income_tax_december()
-                
-                # Persist tax-related fields so subsequent operations use the new values
-                for field in ("tax", "tax_type", "pph21_info"):
-                    try:
-                        # Check if the field exists in the doctype before setting
-                        if salary_slip_meta.has_field(field):
-                            slip_obj.db_set(field, getattr(slip_obj, field))
-                    except Exception as field_error:
-                        # Best effort: attribute might not be saved yet
-                        setattr(slip_obj, field, getattr(slip_obj, field))
             
             return self._process_salary_slips(calculate_december_tax)
         except Exception as e:
@@ -204,151 +228,27 @@ class CustomPayrollEntry(PayrollEntry):
             return []
             
         logger.info(f"Processing {len(slips)} salary slips for payroll entry {self.name}")
-        processed_slips: List[str] = []
-        invalid_slips = []
         
         # Check if salary_slips child table exists before processing
         has_child_table = hasattr(self, "salary_slips")
-        if has_child_table:
-            # Build a map of salary slip references in the child table
-            child_slip_map = {}
-            for i, row in enumerate(self.salary_slips):
-                slip_name = getattr(row, "salary_slip", None)
-                if slip_name:
-                    child_slip_map[slip_name] = i
-        
-        # Get Salary Slip doctype metadata once for field checks
-        salary_slip_meta = frappe.get_meta("Salary Slip")
-        
-        # List of fields that are considered "light" (don't require full save)
-        light_fields = {"tax", "tax_type", "pph21_info"}
         
-        for name in slips:
-            # First check if the slip exists to avoid unnecessary exceptions
-            if not frappe.db.exists("Salary Slip", name):
-                logger.warning(f"Salary Slip '{name}' not found in database. Skipping.")
-                invalid_slips.append(name)
-                continue
-                
-            try:
-                slip_obj = frappe.get_doc("Salary Slip", name)
-                
-                # Store original values of light fields to check if they changed
-                original_values = {}
-                for field in light_fields:
-                    if salary_slip_meta.has_field(field):
-                        original_values[field] = getattr(slip_obj, field, None)
-            except Exception as e:
-                logger.warning(f"Error fetching Salary Slip '{name}': {str(e)}. Skipping.")
-                invalid_slips.append(name)
-                continue
-
-            try:
-                # Apply the provided tax calculation function
-                tax_calculator(slip_obj)
-                
-                # Check if only light fields were modified
-                only_light_fields_changed = True
-                changed_fields = []
-                
-                # Check if light fields changed
-                for field in light_fields:
-                    if salary_slip_meta.has_field(field):
-                        new_value = getattr(slip_obj, field, None)
-                        if field in original_values and original_values[field] != new_value:
-                            changed_fields.append(field)
-                
-                # Check if earnings or deductions tables were modified
-                # This is more accurate than just checking for attribute existence
-                earnings_modified = False
-                deductions_modified = False
-                
-                # Check if earnings were modified (if the table exists)
-                if hasattr(slip_obj, "earnings") and getattr(slip_obj, "earnings", None):
-                    for row in slip_obj.earnings:
-                        if row.modified or row.get("__islocal"):
-                            earnings_modified = True
-                            break
-                
-                # Check if deductions were modified (if the table exists)
-                if hasattr(slip_obj, "deductions") and getattr(slip_obj, "deductions", None):
-                    for row in slip_obj.deductions:
-                        if row.modified or row.get("__islocal"):
-                            deductions_modified = True
-                            break
-                
-                # If no light fields changed OR earnings/deductions were modified, need full save
-                if not changed_fields or earnings_modified or deductions_modified:
-                    only_light_fields_changed = False
-                
-                # If only light fields changed, use db_set for each field
-                if only_light_fields_changed:
-                    for field in changed_fields:
-                        slip_obj.db_set(field, getattr(slip_obj, field), update_modified=False)
-                    logger.debug(f"Updated light fields for slip {name}: {', '.join(changed_fields)}")
-                else:
-                    # Full save needed
-                    slip_obj.save(ignore_permissions=True)
-                    logger.debug(f"Performed full save for slip {name}")
-                
-                # Submit the salary slip if auto_submit is enabled and slip is not already submitted
-                if hasattr(self, "auto_submit_salary_slips") and self.auto_submit_salary_slips and slip_obj.docstatus == 0:
-                    slip_obj.submit()
-                    logger.info(f"Submitted salary slip: {name}")
-                
-                processed_slips.append(name)
-                logger.info(f"Successfully processed slip: {name}")
-            except Exception as e:
-                error_trace = traceback.format_exc()
-                tax_mode = "December" if getattr(slip_obj, "tax_type", "") == "DECEMBER" else "TER"
-                frappe.log_error(
-                    message=f"Failed to process {tax_mode} Salary Slip '{name}': {str(e)}\n{error_trace}",
-                    title=f"Payroll Indonesia {tax_mode} Processing Error"
-                )
-                logger.error(f"Error processing {tax_mode} Salary Slip '{name}': {str(e)}")
-                invalid_slips.append(name)
-                
-                # Clean up any partial Annual Payroll History entries
-                try:
-                    # Get employee and fiscal year info from the slip
-                    employee_doc = self._get_employee_doc(slip_obj)
-                    
-                    if employee_doc and employee_doc.get('name'):
-                        fiscal_year = getattr(slip_obj, "fiscal_year", None)
-                        if not fiscal_year and hasattr(slip_obj, "start_date") and slip_obj.start_date:
-                            try:
-                                from frappe.utils import getdate
-                                fiscal_year = str(getdate(slip_obj.start_date).year)
-                            except Exception:
-                                pass
-                        
-                        # If we have the necessary data, clean up the history entry
-                        if fiscal_year:
-                            sync_annual_payroll_history(
-                                employee=employee_doc,
-                                fiscal_year=fiscal_year,
-                                monthly_results=None,
-                                summary=None,
-                                cancelled_salary_slip=name,
-                                error_state={
-                                    "error": str(e),
-                                    "error_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                                    "payroll_entry": self.name
-                                }
-                            )
-                            logger.info(f"Cleaned up Annual Payroll History for failed slip {name}")
-                except Exception as cleanup_error:
-                    # Log error but continue processing other slips
-                    cleanup_trace = traceback.format_exc()
-                    frappe.log_error(
-                        message=f"Failed to clean up Annual Payroll History for {name}: {str(cleanup_error)}\n{cleanup_trace}",
-                        title="Payroll Indonesia History Cleanup Error"
-                    )
-                    logger.warning(f"Failed to clean up Annual Payroll History for {name}: {str(cleanup_error)}")
+        workers = self._get_parallel_slip_workers(len(slips))
+        if workers > 1:
+            processed_slips, invalid_slips = self._process_slip_batches_parallel(
+                slips, tax_calculator, workers
+            )
+        else:
+            processed_slips, invalid_slips = self._process_slip_batch(slips, tax_calculator)
         
         # Remove invalid slips from the salary_slips child table
         child_table_modified = False
         if invalid_slips and has_child_table:
+            # Map salary slip references in the child table, only needed on failures
+            child_slip_map = {
+                row.salary_slip: i
+                for i, row in enumerate(self.salary_slips)
+                if getattr(row, "salary_slip", None)
+            }
             # Process in reverse order to avoid index shifting problems
             invalid_indices = [child_slip_map[name] for name in invalid_slips 
                               if name in child_slip_map]
@@ -376,25 +276,431 @@ class CustomPayrollEntry(PayrollEntry):
             
         return processed_slips
 
-    def _get_employee_doc(self, slip):
+    def _get_parallel_slip_workers(self, slip_count: int) -> int:
         """
-        Helper to get employee doc/dict from slip.
+        Number of worker threads for slip processing.
+        Parallel processing is opt-in via ``payroll_indonesia_parallel_slips`` in
+        site config; otherwise slips are processed in the request thread.
+        ``payroll_workers`` caps the pool size (default 8) and should stay below
+        the database connection limit.
         """
-        if hasattr(slip, "employee"):
-            if isinstance(slip.employee, dict):
-                return slip.employee
+        if not frappe.conf.get("payroll_indonesia_parallel_slips") or frappe.flags.in_test:
+            return 1
+        try:
+            max_workers = int(frappe.conf.get("payroll_workers") or 8)
+        except (TypeError, ValueError):
+            max_workers = 8
+        return max(1, min(max_workers, slip_count))
+
+    def _process_slip_batches_parallel(
+        self, slips: List[str], tax_calculator: Callable[[Any], None], workers: int
+    ) -> Tuple[List[str], List[str]]:
+        """
+        Process slips in worker threads, each with its own database connection.
+        The current transaction is committed first so workers can see the slips,
+        and each worker commits its own batch.
+        
+        Enabling ``payroll_indonesia_parallel_slips`` gives up the atomicity of the
+        Payroll Entry request: everything written before this call is committed
+        here, and batches that succeed stay committed even if a later step of
+        the request fails.
+        
+        A batch that fails as a whole (connection error, failed commit) is rolled
+        back and its slips are reported as invalid, so the remaining batches and
+        the Payroll Entry stay consistent with what was actually committed.
+        """
+        # Seed the employee cache on the request connection; every worker gets
+        # its own copy of this document and cache instead of sharing ``self``
+        employee_cache = self._get_employee_cache()
+        frappe.db.commit()
+        site = frappe.local.site
+        sites_path = frappe.local.sites_path
+        user = frappe.session.user
+
+        def run_batch(
+            args: Tuple[Any, List[str]]
+        ) -> Tuple[List[str], List[str], List[Tuple[str, str]]]:
+            entry, names = args
             try:
-                return frappe.get_doc("Employee", slip.employee)
-            except Exception:
-                return {}
-        if isinstance(slip, dict) and "employee" in slip:
-            if isinstance(slip["employee"], dict):
-                return slip["employee"]
+                frappe.init(site=site, sites_path=sites_path)
+                frappe.connect()
+                frappe.set_user(user)
+                processed, invalid = entry._process_slip_batch(names, tax_calculator)
+                frappe.db.commit()
+                return processed, invalid, []
+            except Exception as e:
+                try:
+                    frappe.db.rollback()
+                except Exception:
+                    pass
+                logger.error("Batch of %s salary slips failed for %s: %s", len(names), entry.name, e)
+                # Error Log is written from the request thread once all batches are done
+                return [], list(names), [(
+                    "Payroll Indonesia Parallel Batch Error",
+                    f"Failed to process {len(names)} salary slips for {entry.name}: {str(e)}\n"
+                    f"{traceback.format_exc()}",
+                )]
+            finally:
+                frappe.destroy()
+
+        batches = []
+        for i in range(workers):
+            entry = copy.copy(self)
+            entry._employee_cache = dict(employee_cache)
+            batches.append((entry, slips[i::workers]))
+
+        processed_slips: List[str] = []
+        invalid_slips: List[str] = []
+        errors: List[Tuple[str, str]] = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for batch_processed, batch_invalid, batch_errors in executor.map(run_batch, batches):
+                processed_slips.extend(batch_processed)
+                invalid_slips.extend(batch_invalid)
+                errors.extend(batch_errors)
+
+        _log_errors(errors)
+
+        # Keep the original slip order for callers, independent of how the
+        # batches were interleaved across workers
+        order = {name: i for i, name in enumerate(slips)}
+        processed_slips.sort(key=order.__getitem__)
+        invalid_slips.sort(key=order.__getitem__)
+        return processed_slips, invalid_slips
+
+    def _process_slip_batch(
+        self, names: List[str], tax_calculator: Callable[[Any], None]
+    ) -> Tuple[List[str], List[str]]:
+        """
+        Recalculate tax for the given salary slips and persist the results.
+        
+        Args:
+            names: Salary Slip names to process
+            tax_calculator: Callback function that calculates tax for a salary slip
+        
+        Returns:
+            Tuple of (processed slip names, invalid slip names)
+        """
+        processed_slips: List[str] = []
+        invalid_slips: List[str] = []
+        
+        # Fields that are considered "light" (don't require full save), limited
+        # once per batch to those present on this site's Salary Slip
+        salary_slip_meta = frappe.get_meta("Salary Slip")
+        light_fields = tuple(
+            field for field in ("tax", "tax_type", "pph21_info")
+            if salary_slip_meta.has_field(field)
+        )
+        
+        # Light field changes are collected and written in one statement after the loop
+        light_updates: Dict[str, Dict[str, Any]] = {}
+        
+        # Failed slips as (name, slip, error, error_at), cleaned up after the loop
+        failed_slips: List[Tuple[str, Any, str, str]] = []
+        # Error Log entries as (title, message), written once after the loop
+        errors: List[Tuple[str, str]] = []
+        
+        # Resolve frappe proxies and the log level once instead of on every iteration
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+        auto_submit = bool(getattr(self, "auto_submit_salary_slips", False))
+        get_doc = frappe.get_doc
+        
+        slip_docs: Dict[str, Any] = {}
+        existing: set = set()
+        # Submitted slips queue their Annual Payroll History rows; they are
+        # written once per employee when the loop is done
+        submitted_docs: Dict[str, Any] = {}
+        failed_sync_slips: List[str] = []
+        sync_context = (
+            deferred_annual_payroll_sync(failed_sync_slips) if auto_submit else nullcontext()
+        )
+        with sync_context:
+            for idx, name in enumerate(names):
+                # Load the next chunk of slips with one query per table
+                if idx % SLIP_PREFETCH_SIZE == 0:
+                    chunk = names[idx:idx + SLIP_PREFETCH_SIZE]
+                    slip_docs = self._load_salary_slips(chunk)
+                    # The batch load doubles as the existence check; query names
+                    # only if it came back empty
+                    existing = set(slip_docs) or set(
+                        frappe.get_all("Salary Slip", filters={"name": ["in", chunk]}, pluck="name")
+                    )
+            
+                # First check if the slip exists to avoid unnecessary exceptions
+                if name not in existing:
+                    logger.warning("Salary Slip '%s' not found in database. Skipping.", name)
+                    invalid_slips.append(name)
+                    continue
+                
+                try:
+                    slip_obj = slip_docs.pop(name, None) or get_doc("Salary Slip", name)
+                
+                    # Store original values of light fields to check if they changed
+                    original_values = {field: getattr(slip_obj, field, None) for field in light_fields}
+                except Exception as e:
+                    logger.warning("Error fetching Salary Slip '%s': %s. Skipping.", name, e)
+                    invalid_slips.append(name)
+                    continue
+
+                try:
+                    # Apply the provided tax calculation function
+                    tax_calculator(slip_obj)
+                
+                    # Check if light fields changed
+                    changed_fields = [
+                        field for field in light_fields
+                        if original_values[field] != getattr(slip_obj, field, None)
+                    ]
+                
+                    # A full save is needed if no light field changed or if any
+                    # earnings/deductions row was modified or added
+                    only_light_fields_changed = bool(changed_fields) and not any(
+                        row.modified or row.get("__islocal")
+                        for table in ("earnings", "deductions")
+                        for row in (getattr(slip_obj, table, None) or ())
+                    )
+                
+                    # If only light fields changed, queue them for the bulk UPDATE
+                    if only_light_fields_changed:
+                        light_updates[name] = {field: getattr(slip_obj, field) for field in changed_fields}
+                        if debug_enabled:
+                            logger.debug(
+                                "Queued light field update for slip %s: %s", name, ", ".join(changed_fields)
+                            )
+                    else:
+                        # Full save needed. This is a system recalculation of slips the
+                        # entry just created: skip Version rows and link re-validation.
+                        slip_obj.flags.ignore_version = True
+                        slip_obj.flags.ignore_links = True
+                        slip_obj.save(ignore_permissions=True)
+                        if debug_enabled:
+                            logger.debug("Performed full save for slip %s", name)
+                
+                    # Submit the salary slip if auto_submit is enabled and slip is not already submitted
+                    if auto_submit and slip_obj.docstatus == 0:
+                        slip_obj.submit()
+                        submitted_docs[name] = slip_obj
+                        if debug_enabled:
+                            logger.debug("Submitted salary slip: %s", name)
+                
+                    processed_slips.append(name)
+                    if debug_enabled:
+                        logger.debug("Successfully processed slip: %s", name)
+                except Exception as e:
+                    error_trace = traceback.format_exc()
+                    tax_mode = "December" if getattr(slip_obj, "tax_type", "") == "DECEMBER" else "TER"
+                    errors.append((
+                        f"Payroll Indonesia {tax_mode} Processing Error",
+                        f"Failed to process {tax_mode} Salary Slip '{name}': {str(e)}\n{error_trace}",
+                    ))
+                    logger.error("Error processing %s Salary Slip '%s': %s", tax_mode, name, e)
+                    invalid_slips.append(name)
+                    failed_slips.append(
+                        (name, slip_obj, str(e), datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+                    )
+        
+        # A slip whose Annual Payroll History could not be written is already
+        # submitted: it stays processed and linked to this entry, only the sync
+        # error is recorded (the Error Log entry is written by the flush)
+        sync_errors: List[Tuple[str, Any, str, str]] = []
+        if failed_sync_slips:
+            error_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            sync_errors = [
+                (name, submitted_docs[name], "Annual Payroll History sync failed", error_at)
+                for name in dict.fromkeys(failed_sync_slips)
+                if name in submitted_docs
+            ]
+            logger.error(
+                "Annual Payroll History sync failed for %s submitted salary slips", len(sync_errors)
+            )
+        
+        if light_updates:
+            frappe.db.bulk_update("Salary Slip", light_updates, update_modified=False)
+            logger.debug("Updated light fields for %s salary slips", len(light_updates))
+        
+        # Clean up any partial Annual Payroll History entries
+        if failed_slips:
+            self._cleanup_failed_slips(failed_slips, errors)
+        if sync_errors:
+            self._cleanup_failed_slips(sync_errors, errors, remove_from_history=False)
+        
+        _log_errors(errors)
+        return processed_slips, invalid_slips
+
+    def _cleanup_failed_slips(
+        self,
+        failed_slips: List[Tuple[str, Any, str, str]],
+        errors: List[Tuple[str, str]],
+        remove_from_history: bool = True,
+    ) -> None:
+        """
+        Remove failed slips from Annual Payroll History and record the error state.
+        
+        Employees of all failed slips are loaded with one query before the cleanup.
+        
+        Args:
+            failed_slips: Tuples of (slip name, slip document, error message, error time)
+            errors: Buffer that cleanup failures are appended to as (title, message)
+            remove_from_history: Remove the slips' monthly rows; False only records
+                the error state, for submitted slips whose history sync failed
+        """
+        self._cache_employees(
+            [getattr(slip_obj, "employee", None) for _, slip_obj, _, _ in failed_slips]
+        )
+        
+        # All slips of an entry share its period, so the entry's year is the
+        # fiscal year unless the slip says otherwise
+        entry_fiscal_year = None
+        if getattr(self, "start_date", None):
             try:
-                return frappe.get_doc("Employee", slip["employee"])
+                entry_fiscal_year = str(frappe.utils.getdate(self.start_date).year)
             except Exception:
+                pass
+        
+        for name, slip_obj, error, error_at in failed_slips:
+            try:
+                # Get employee and fiscal year info from the slip
+                employee_doc = self._get_employee_doc(slip_obj)
+                
+                if employee_doc and employee_doc.get('name'):
+                    fiscal_year = getattr(slip_obj, "fiscal_year", None) or entry_fiscal_year
+                    if not fiscal_year and getattr(slip_obj, "start_date", None):
+                        try:
+                            fiscal_year = str(frappe.utils.getdate(slip_obj.start_date).year)
+                        except Exception:
+                            pass
+                    
+                    # If we have the necessary data, clean up the history entry
+                    if fiscal_year:
+                        sync_annual_payroll_history(
+                            employee=employee_doc,
+                            fiscal_year=fiscal_year,
+                            monthly_results=None,
+                            summary=None,
+                            cancelled_salary_slip=name if remove_from_history else None,
+                            error_state={
+                                "error": error,
+                                "error_at": error_at,
+                                "payroll_entry": self.name
+                            }
+                        )
+                        logger.info("Updated Annual Payroll History for failed slip %s", name)
+            except Exception as cleanup_error:
+                # Log error but continue with the other slips
+                cleanup_trace = traceback.format_exc()
+                errors.append((
+                    "Payroll Indonesia History Cleanup Error",
+                    f"Failed to clean up Annual Payroll History for {name}: {str(cleanup_error)}\n{cleanup_trace}",
+                ))
+                logger.warning("Failed to clean up Annual Payroll History for %s: %s", name, cleanup_error)
+
+    def _load_salary_slips(self, names: List[str]) -> Dict[str, Any]:
+        """
+        Build Salary Slip documents for the given names from batched queries.
+        
+        The parent rows and each child table are read with one query each instead
+        of the 1 + (number of tables) queries ``frappe.get_doc`` issues per slip.
+        
+        Args:
+            names: Salary Slip names to load
+        
+        Returns:
+            Dictionary of Salary Slip documents keyed by name. Slips that could
+            not be loaded are left out so callers fall back to ``frappe.get_doc``.
+        """
+        if not names:
+            return {}
+        
+        try:
+            parents = frappe.get_all(
+                "Salary Slip", filters={"name": ["in", names]}, fields=["*"]
+            )
+            if not parents:
                 return {}
-        return {}
+            
+            rows_by_parent: Dict[str, Dict[str, List[Dict[str, Any]]]] = {
+                row.name: {} for row in parents
+            }
+            table_fields = frappe.get_meta("Salary Slip").get_table_fields()
+            for child_doctype in {df.options for df in table_fields}:
+                for child in frappe.get_all(
+                    child_doctype,
+                    filters={"parent": ["in", list(rows_by_parent)], "parenttype": "Salary Slip"},
+                    fields=["*"],
+                    order_by="idx asc",
+                ):
+                    rows_by_parent[child.parent].setdefault(child.parentfield, []).append(child)
+            
+            docs = {}
+            for row in parents:
+                children = rows_by_parent[row.name]
+                for df in table_fields:
+                    row[df.fieldname] = children.get(df.fieldname, [])
+                row["doctype"] = "Salary Slip"
+                docs[row.name] = frappe.get_doc(row)
+            return docs
+        except Exception as e:
+            logger.warning(f"Batch loading of salary slips failed, loading individually: {str(e)}")
+            return {}
+
+    def _get_employee_doc(self, slip):
+        """
+        Helper to get the employee dict for a salary slip.
+        """
+        employee = getattr(slip, "employee", None)
+        if not employee or isinstance(employee, dict):
+            return employee or {}
+        try:
+            return self._get_cached_employee(employee)
+        except Exception:
+            return {}
+
+    def _get_employee_cache(self) -> Dict[str, Any]:
+        """
+        Return the per-instance employee cache, seeding it on first use with all
+        employees of this Payroll Entry in a single query.
+        """
+        cache = getattr(self, "_employee_cache", None)
+        if cache is None:
+            cache = self._employee_cache = {}
+            employees = [row.employee for row in (self.get("employees") or []) if row.employee]
+            self._cache_employees(employees)
+        return cache
+
+    def _cache_employees(self, employees: List[Any]) -> None:
+        """
+        Load employees that are not cached yet with one query.
+        
+        Args:
+            employees: Employee names; empty values and dicts are ignored
+        """
+        cache = self._get_employee_cache()
+        missing = list({
+            employee for employee in employees
+            if employee and isinstance(employee, str) and employee not in cache
+        })
+        if not missing:
+            return
+        for row in frappe.get_all(
+            "Employee",
+            filters={"name": ["in", missing]},
+            fields=["name", "company", "employee_name"],
+        ):
+            cache[row.name] = row
+
+    def _get_cached_employee(self, employee: str) -> Dict[str, Any]:
+        """
+        Return the fields needed for Annual Payroll History cleanup for an employee.
+        Employees are served from the per-instance cache; unknown employees fall
+        back to a single-row lookup of the same fields.
+        """
+        cache = self._get_employee_cache()
+        if employee not in cache:
+            cache[employee] = frappe._dict(
+                frappe.db.get_value(
+                    "Employee", employee, ["name", "company", "employee_name"], as_dict=True
+                ) or {}
+            )
+        return cache[employee]
         
     def on_cancel(self):
         """
@@ -464,33 +770,35 @@ class CustomPayrollEntry(PayrollEntry):
                 action = "Cleaning up" if force_cleanup else "Deleting"
                 logger.info(f"{action} {len(salary_slips)} salary slips for Payroll Entry {self.name}")
                 
-                # Process each salary slip: cancel if submitted, then delete
+                # Submitted slips are cancelled through the ORM so their on_cancel
+                # hooks (Annual Payroll History sync) still run. Cancelled slips are
+                # payroll records and go through frappe.delete_doc (Deleted Document
+                # backup, on_trash, link checks); only drafts are bulk deleted.
+                drafts = []
+                errors: List[Tuple[str, str]] = []
                 for slip in salary_slips:
+                    if slip.docstatus == 0:
+                        drafts.append(slip.name)
+                        continue
                     try:
-                        slip_name = slip.name
-                        
-                        # Skip if slip doesn't exist (already deleted)
-                        if not frappe.db.exists("Salary Slip", slip_name):
-                            continue
-                            
-                        # Cancel if submitted (docstatus == 1)
                         if slip.docstatus == 1:
-                            logger.info(f"Canceling Salary Slip {slip_name}")
-                            frappe.get_doc("Salary Slip", slip_name).cancel()
-                        
-                        # Delete with force=True and ignore_permissions=True to bypass restrictions
-                        logger.info(f"Deleting Salary Slip {slip_name}")
-                        frappe.delete_doc("Salary Slip", slip_name, force=True, ignore_permissions=True)
-                        
+                            logger.debug(f"Canceling Salary Slip {slip.name}")
+                            frappe.get_doc("Salary Slip", slip.name).cancel()
+                        logger.debug(f"Deleting Salary Slip {slip.name}")
+                        frappe.delete_doc("Salary Slip", slip.name, force=True, ignore_permissions=True)
                     except Exception as slip_error:
                         # Log error but continue with other slips
                         error_trace = traceback.format_exc()
-                        frappe.log_error(
-                            message=f"Error deleting Salary Slip {slip.name}: {str(slip_error)}\n{error_trace}",
-                            title="Payroll Indonesia Salary Slip Deletion Error"
-                        )
+                        errors.append((
+                            "Payroll Indonesia Salary Slip Deletion Error",
+                            f"Error deleting Salary Slip {slip.name}: {str(slip_error)}\n{error_trace}",
+                        ))
                         logger.warning(f"Error deleting Salary Slip {slip.name}: {str(slip_error)}")
                 
+                # Draft slips generated by this entry are removed with bulk deletes
+                self._bulk_delete_draft_salary_slips(drafts)
+                _log_errors(errors)
+                
                 logger.info(f"Successfully {action.lower()} all salary slips for Payroll Entry {self.name}")
                 
         except TimeoutError:
@@ -508,6 +816,44 @@ class CustomPayrollEntry(PayrollEntry):
             )
             logger.error(f"Error in delete_salary_slips: {str(e)}")
             
+    def _bulk_delete_draft_salary_slips(self, names: List[str]) -> None:
+        """
+        Delete draft Salary Slips of this Payroll Entry and their rows in bulk.
+        
+        Issues one DELETE per child table, one for the slips and one each for
+        their Version and Comment rows instead of running ``frappe.delete_doc``
+        per slip. Draft slips were never submitted, so skipping the Deleted
+        Document backup and ``on_trash`` only affects slips this entry generated
+        and is about to regenerate or discard. Names are re-checked against
+        this entry and docstatus 0 first, so a slip submitted in the meantime
+        is never removed here.
+        
+        Args:
+            names: Draft Salary Slip names linked to this Payroll Entry
+        """
+        if not names:
+            return
+        
+        names = frappe.get_all(
+            "Salary Slip",
+            filters={"name": ["in", names], "payroll_entry": self.name, "docstatus": 0},
+            pluck="name",
+        )
+        if not names:
+            return
+        
+        for child_doctype in {df.options for df in frappe.get_meta("Salary Slip").get_table_fields()}:
+            frappe.db.delete(child_doctype, {"parent": ["in", names], "parenttype": "Salary Slip"})
+        frappe.db.delete("Salary Slip", {"name": ["in", names]})
+        frappe.db.delete("Version", {"ref_doctype": "Salary Slip", "docname": ["in", names]})
+        frappe.db.delete(
+            "Comment", {"reference_doctype": "Salary Slip", "reference_name": ["in", names]}
+        )
+        
+        for name in names:
+            frappe.clear_document_cache("Salary Slip", name)
+        logger.debug(f"Deleted {len(names)} draft salary slips")
+
     def _clear_stale_locks(self, lock_path):
         """
         Check for and clear stale locks to prevent deadlocks.
@@ -521,16 +867,20 @@ class CustomPayrollEntry(PayrollEntry):
             site_path = frappe.get_site_path()
             full_lock_path = os.path.join(site_path, lock_path)
             
-            # Check if lock file exists
-            if os.path.exists(full_lock_path):
-                # Get file modification time
-                mod_time = os.path.getmtime(full_lock_path)
-                current_time = time.time()
-                
-                # If lock is older than 10 minutes (600 seconds), it's stale
-                if current_time - mod_time > 600:
-                    logger.warning(f"Clearing stale lock file: {lock_path}")
-                    os.remove(full_lock_path)
+            # A single stat both checks existence and returns the modification time
+            try:
+                mod_time = os.stat(full_lock_path).st_mtime
+            except FileNotFoundError:
+                return
+            
+            # If lock is older than 10 minutes (600 seconds), it's stale
+            if time.time() - mod_time > 600:
+                logger.warning(f"Clearing stale lock file: {lock_path}")
+                try:
+                    os.unlink(full_lock_path)
+                except FileNotFoundError:
+                    # Released by its owner in the meantime
+                    pass
         except Exception as e:
             # Log but continue - not critical
             logger.warning(f"Error checking/clearing stale lock {lock_path}: {str(e)}")
@@ -570,18 +920,20 @@ class CustomPayrollEntry(PayrollEntry):
             logger.info(f"Canceling {len(journal_entries)} journal entries for Payroll Entry {self.name}")
             
             # Cancel each journal entry
+            errors: List[Tuple[str, str]] = []
             for je in journal_entries:
                 try:
                     frappe.get_doc("Journal Entry", je).cancel()
-                    logger.info(f"Canceled Journal Entry {je}")
+                    logger.debug(f"Canceled Journal Entry {je}")
                 except Exception as je_error:
                     # Log error but continue with other journal entries
                     error_trace = traceback.format_exc()
-                    frappe.log_error(
-                        message=f"Error canceling Journal Entry {je}: {str(je_error)}\n{error_trace}",
-                        title="Payroll Indonesia Journal Entry Cancellation Error"
-                    )
+                    errors.append((
+                        "Payroll Indonesia Journal Entry Cancellation Error",
+                        f"Error canceling Journal Entry {je}: {str(je_error)}\n{error_trace}",
+                    ))
                     logger.warning(f"Error canceling Journal Entry {je}: {str(je_error)}")
+            _log_errors(errors)
             
             logger.info(f"Successfully canceled all journal entries for Payroll Entry {self.name}")
             
@@ -22,18 +22,42 @@ except ImportError:
         title="Payroll Indonesia Import Warning",
     )
 
+import ast
 import json
 import traceback
+import unicodedata
+from functools import lru_cache
+from types import MappingProxyType
+from datetime import datetime
+
 import frappe
 from frappe.utils import flt
 try:
     from frappe.utils import getdate
 except Exception:  # pragma: no cover
-    from datetime import datetime
     def getdate(value):
         return datetime.strptime(str(value), "%Y-%m-%d")
 
+try:
+    from frappe.utils import money_in_words
+except ImportError:  # pragma: no cover
+    money_in_words = None
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - fallback ke json standar
+    orjson = None
+
 from frappe.utils.safe_exec import safe_eval
+try:
+    from frappe.utils.safe_exec import WHITELISTED_SAFE_EVAL_GLOBALS, _validate_safe_eval_syntax
+except ImportError:  # pragma: no cover - framework tanpa validator terpisah
+    WHITELISTED_SAFE_EVAL_GLOBALS = None
+    _validate_safe_eval_syntax = None
+try:
+    from frappe.utils.safe_exec import UNSAFE_ATTRIBUTES
+except ImportError:  # pragma: no cover - framework lama
+    UNSAFE_ATTRIBUTES = ()
 
 # Hitung PPh
 from payroll_indonesia.config.pph21_ter import calculate_pph21_TER
@@ -45,11 +69,117 @@ from payroll_indonesia.config.pph21_ter_december import (
 )
 
 # Sinkronisasi Annual Payroll History
-from payroll_indonesia.utils.sync_annual_payroll_history import sync_annual_payroll_history
-from payroll_indonesia import _patch_salary_slip_globals
+from payroll_indonesia.utils.sync_annual_payroll_history import (
+    get_deferred_sync_buffer,
+    sync_annual_payroll_history,
+)
+from payroll_indonesia import get_salary_slip_globals
 
 logger = frappe.logger("payroll_indonesia")
 
+_FORMULA_GLOBALS = (
+    {"__builtins__": {}, **WHITELISTED_SAFE_EVAL_GLOBALS}
+    if WHITELISTED_SAFE_EVAL_GLOBALS is not None
+    else None
+)
+
+
+# Formula/condition Salary Structure yang sudah divalidasi & di-compile, per teks
+# ekspresi; dibatasi agar worker yang lama hidup tidak menumpuk struktur lama
+@lru_cache(maxsize=512)
+def _compile_formula(expr):
+    """Validasi + compile ekspresi sekali per teks ekspresi."""
+    normalized = unicodedata.normalize("NFKC", expr)
+    _check_formula_attributes(normalized)
+    _validate_safe_eval_syntax(normalized)
+    return compile(normalized, "<formula>", "eval")
+
+
+# Atribut yang ditolak pada formula, sama seperti pemeriksaan formula Salary Slip HRMS
+_UNSAFE_FORMULA_ATTRIBUTES = frozenset(UNSAFE_ATTRIBUTES) | {"__"}
+
+
+def _check_formula_attributes(expr):
+    """Tolak dunder / atribut berbahaya sebelum ekspresi di-compile."""
+    for attribute in _UNSAFE_FORMULA_ATTRIBUTES - {"format"}:
+        if attribute in expr:
+            raise SyntaxError(f'Illegal rule {expr}. Cannot use "{attribute}"')
+    for node in ast.walk(ast.parse(expr, mode="eval")):
+        if isinstance(node, ast.Attribute) and (
+            node.attr.startswith("__") or node.attr in _UNSAFE_FORMULA_ATTRIBUTES
+        ):
+            raise SyntaxError(f'Illegal rule {expr}. Cannot use "{node.attr}"')
+
+
+def _eval_formula(expr, context):
+    """
+    Evaluasi formula seperti safe_eval, tetapi parse + validasi AST hanya sekali
+    per ekspresi. Tanpa validator framework, kembali ke safe_eval biasa.
+
+    ``context`` dipakai sebagai globals eval (seperti safe_eval), sehingga nama
+    slip dan hook tetap terlihat di dalam comprehension/generator. Builtins
+    whitelist ditambahkan ke dict ini, jadi berikan salinan per baris.
+    """
+    if _validate_safe_eval_syntax is None:
+        return safe_eval(expr, context)
+    context.update(_FORMULA_GLOBALS)
+    return eval(_compile_formula(expr), context)
+
+
+def _row_value(row, field, default=None):
+    """Baca field baris child table, baik dict maupun Document."""
+    if isinstance(row, dict):
+        return row.get(field, default)
+    return getattr(row, field, default)
+
+
+def _dumps_pph21_info(result):
+    """Serialisasi pph21_info; orjson bila tersedia (kunci non-string tetap didukung)."""
+    if orjson is not None:
+        return orjson.dumps(result, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(result)
+
+
+def precompile_structure_formulas(rows):
+    """
+    Isi cache _compile_formula untuk condition/formula baris Salary Structure, sehingga
+    slip pertama tidak menanggung parse. Ekspresi tidak valid dilewati di sini
+    dan tetap dilaporkan saat evaluasi slip seperti sebelumnya.
+    """
+    if _validate_safe_eval_syntax is None:
+        return
+    for row in rows or []:
+        for field in ("condition", "formula"):
+            expr = _row_value(row, field)
+            if not expr:
+                continue
+            try:
+                _compile_formula(expr)
+            except Exception as e:
+                logger.debug("Skip precompile %s: %s", expr, e)
+
+
+# Nama bulan (Inggris/Indonesia, lengkap/singkat) -> nomor bulan
+_MONTH_MAP = MappingProxyType({
+    "january": 1, "jan": 1, "januari": 1,
+    "february": 2, "feb": 2, "februari": 2,
+    "march": 3, "mar": 3, "maret": 3,
+    "april": 4, "may": 5, "mei": 5,
+    "june": 6, "jun": 6, "juni": 6,
+    "july": 7, "jul": 7, "juli": 7,
+    "august": 8, "aug": 8, "agustus": 8,
+    "september": 9, "sep": 9,
+    "october": 10, "oct": 10, "oktober": 10,
+    "november": 11, "nov": 11,
+    "december": 12, "dec": 12, "desember": 12,
+})
+
+# Kolom Employee yang dipakai perhitungan PPh21 dan Annual Payroll History
+EMPLOYEE_TAX_FIELDS = ("name", "company", "employee_name", "employment_type", "tax_status")
+
+# Komponen potongan JP+JHT bagian karyawan (nama lowercase) untuk perhitungan Desember
+_JP_JHT_COMPONENTS = frozenset(("bpjs jht employee", "bpjs jp employee"))
+
 
 class CustomSalarySlip(SalarySlip):
     """Salary Slip override dengan logika PPh21 Indonesia."""
@@ -63,71 +193,90 @@ class CustomSalarySlip(SalarySlip):
             try:
                 bulan = getdate(start_date).month
             except Exception:
-                logger.debug(f"Gagal parsing start_date: {start_date}")
+                logger.debug("Gagal parsing start_date: %s", start_date)
 
         if not bulan and nama_bulan:
-            peta = {
-                "january": 1, "jan": 1, "januari": 1,
-                "february": 2, "feb": 2, "februari": 2,
-                "march": 3, "mar": 3, "maret": 3,
-                "april": 4, "may": 5, "mei": 5,
-                "june": 6, "jun": 6, "juni": 6,
-                "july": 7, "jul": 7, "juli": 7,
-                "august": 8, "aug": 8, "agustus": 8,
-                "september": 9, "sep": 9,
-                "october": 10, "oct": 10, "oktober": 10,
-                "november": 11, "nov": 11,
-                "december": 12, "dec": 12, "desember": 12,
-            }
-            bulan = peta.get(str(nama_bulan).strip().lower())
+            bulan = _MONTH_MAP.get(str(nama_bulan).strip().lower())
 
         if not bulan:
-            from datetime import datetime
             bulan = datetime.now().month
         return bulan
 
-    def get_employee_doc(self):
-        if hasattr(self, "employee"):
-            emp = self.employee
-            if isinstance(emp, dict):
-                return emp
+    def _get_fiscal_year(self, periode=None):
+        """Tahun fiskal slip: field fiscal_year, jika kosong tahun dari start_date."""
+        fiscal_year = getattr(self, "fiscal_year", None)
+        if fiscal_year:
+            return fiscal_year
+        if periode is None:
+            start_date = getattr(self, "start_date", None)
+            if not start_date:
+                return None
             try:
-                return frappe.get_doc("Employee", emp)
-            except frappe.DoesNotExistError:
-                frappe.log_error(
-                    message=f"Employee '{emp}' not found for Salary Slip {self.name}",
-                    title="Payroll Indonesia Missing Employee Error",
-                )
-                raise frappe.ValidationError(f"Employee '{emp}' not found.")
-        return {}
+                periode = getdate(start_date)
+            except Exception:
+                return str(start_date)[:4] or None
+        return str(periode.year)
+
+    def get_employee_doc(self):
+        emp = getattr(self, "employee", None)
+        if not emp:
+            return {}
+        if isinstance(emp, dict):
+            return emp
+        # Dibaca sekali per slip; di-cache per ID agar perubahan employee tetap terbaca
+        cached = getattr(self, "_employee_doc_cache", None)
+        if cached is not None and cached[0] == emp:
+            return cached[1]
+        # Dari document cache: slip berikutnya untuk employee sama tidak query ulang
+        employee = frappe.get_cached_value("Employee", emp, EMPLOYEE_TAX_FIELDS, as_dict=True)
+        if not employee:
+            frappe.log_error(
+                message=f"Employee '{emp}' not found for Salary Slip {self.name}",
+                title="Payroll Indonesia Missing Employee Error",
+            )
+            raise frappe.ValidationError(f"Employee '{emp}' not found.")
+        self._employee_doc_cache = (emp, employee)
+        return employee
 
     # -------------------------
     # Evaluasi formula
     # -------------------------
     def eval_condition_and_formula(self, struct_row, data):
-        context = data.copy()
-        context.update(_patch_salary_slip_globals())
+        condition = getattr(struct_row, "condition", None)
+        formula = getattr(struct_row, "formula", None)
+        if not condition and not formula:
+            return super().eval_condition_and_formula(struct_row, data)
 
+        extra = {}
         ssa = getattr(self, "salary_structure_assignment", None)
         for f in ("meal_allowance", "transport_allowance"):
             v = getattr(self, f, None)
             if v is None and ssa:
                 v = ssa.get(f) if isinstance(ssa, dict) else getattr(ssa, f, None)
             if v is not None:
-                context[f] = v
+                extra[f] = v
+
+        # Satu dict globals per baris dengan urutan prioritas seperti sebelumnya:
+        # data < globals hook < override SSA (builtins whitelist ditambahkan saat eval)
+        context = {**data, **get_salary_slip_globals(), **extra}
 
         try:
-            if getattr(struct_row, "condition", None):
-                if not safe_eval(struct_row.condition, context):
-                    return 0
-            if getattr(struct_row, "formula", None):
-                return safe_eval(struct_row.formula, context)
+            if condition and not _eval_formula(condition, context):
+                return 0
+            if formula:
+                return _eval_formula(formula, context)
         except Exception as e:
             frappe.throw(
                 f"Failed evaluating formula for {getattr(struct_row, 'salary_component', 'component')}: {e}"
             )
 
-        return super().eval_condition_and_formula(struct_row, data)
+        # Kondisi terpenuhi tanpa formula: nominal tetap baris struktur seperti HRMS,
+        # tanpa mengevaluasi ulang kondisi lewat super()
+        amount = getattr(struct_row, "amount", 0)
+        abbr = getattr(struct_row, "abbr", None)
+        if amount and abbr:
+            data[abbr] = amount
+        return amount
 
     # -------------------------
     # PPh 21 TER (bulanan)
@@ -157,7 +306,7 @@ class CustomSalarySlip(SalarySlip):
             except AttributeError:
                 result["_tax_type"] = "TER"
 
-            self.pph21_info = json.dumps(result)
+            self._set_pph21_info(result)
             self.update_pph21_row(tax_amount)
             return tax_amount
 
@@ -182,33 +331,34 @@ class CustomSalarySlip(SalarySlip):
         ytd_netto = 0.0
         ytd_tax   = 0.0
 
-        fiscal_year = getattr(self, "fiscal_year", None)
-        if not fiscal_year and getattr(self, "start_date", None):
-            fiscal_year = str(getdate(self.start_date).year)
+        fiscal_year = self._get_fiscal_year()
         if not fiscal_year:
             return ytd_bruto, ytd_netto, ytd_tax
 
+        # Hanya query yang dibungkus try; gagal di sini berarti YTD = 0, bukan total parsial
         try:
-            rows = frappe.get_all(
-                "Annual Payroll History",
-                filters={"employee": self.employee, "fiscal_year": fiscal_year},
-                fields=["name"],
-                limit=1,
+            # Satu query: child Jan–Nov di-JOIN ke APH employee/tahun, dijumlahkan di database;
+            # netto kosong diganti bruto - biaya_jabatan - pengurang_netto
+            totals = frappe.db.sql(
+                """
+                SELECT
+                    COALESCE(SUM(d.bruto), 0),
+                    COALESCE(SUM(CASE WHEN IFNULL(d.netto, 0) = 0
+                        THEN IFNULL(d.bruto, 0) - IFNULL(d.biaya_jabatan, 0) - IFNULL(d.pengurang_netto, 0)
+                        ELSE d.netto END), 0),
+                    COALESCE(SUM(d.pph21), 0)
+                FROM `tabAnnual Payroll History Child` d
+                INNER JOIN `tabAnnual Payroll History` h
+                    ON d.parent = h.name AND d.parenttype = 'Annual Payroll History'
+                WHERE h.employee = %s
+                    AND h.fiscal_year = %s
+                    AND h.docstatus < 2
+                    AND d.bulan > 0 AND d.bulan < 12
+                """,
+                (self.employee, fiscal_year),
             )
-            if rows:
-                hist = frappe.get_doc("Annual Payroll History", rows[0].name)
-                for r in hist.get("monthly_details", []) or []:
-                    bln = getattr(r, "bulan", 0)
-                    if bln and bln < 12:
-                        ytd_bruto += flt(getattr(r, "bruto", 0))
-                        # gunakan kolom netto jika tersedia; fallback: bruto - biaya_jabatan - pengurang_netto
-                        r_netto = flt(getattr(r, "netto", 0))
-                        if not r_netto:
-                            r_netto = flt(getattr(r, "bruto", 0)) \
-                                      - flt(getattr(r, "biaya_jabatan", 0)) \
-                                      - flt(getattr(r, "pengurang_netto", 0))
-                        ytd_netto += r_netto
-                        ytd_tax   += flt(getattr(r, "pph21", 0))
+            if totals:
+                ytd_bruto, ytd_netto, ytd_tax = (flt(v) for v in totals[0])
         except Exception as e:
             logger.warning(f"Error fetching YTD from Annual Payroll History: {e}")
 
@@ -231,17 +381,17 @@ class CustomSalarySlip(SalarySlip):
             ytd_bruto_jan_nov, ytd_netto_jan_nov, ytd_tax_paid_jan_nov = self._get_ytd_from_aph()
 
             # === 2) Ambil data Desember dari slip aktif ===
-            slip_dict = self.as_dict()
+            slip_dict = self._as_tax_dict()
             bruto_desember = sum_bruto_earnings(slip_dict)
             pengurang_netto_desember = sum_pengurang_netto_bulanan(slip_dict)
             biaya_jabatan_desember = biaya_jabatan_bulanan(bruto_desember)  # min(5% × bruto Des, 500k)
 
             # >>> PENTING: Baca JP+JHT (EE) bulan Desember dari deduction slip <<<
-            jp_jht_employee_month = 0.0
-            for d in (slip_dict.get("deductions") or []):
-                name = (d.get("salary_component") or "").strip().lower()
-                if name in {"bpjs jht employee", "bpjs jp employee"}:
-                    jp_jht_employee_month += flt(d.get("amount", 0))
+            jp_jht_employee_month = sum(
+                flt(d.get("amount", 0))
+                for d in (slip_dict.get("deductions") or [])
+                if (d.get("salary_component") or "").strip().lower() in _JP_JHT_COMPONENTS
+            )
 
             # === 3) Hitung PPh21 Desember berbasis tahunan (December-only) ===
             result = calculate_pph21_december(
@@ -269,15 +419,16 @@ class CustomSalarySlip(SalarySlip):
                 result["_tax_type"] = "DECEMBER"
 
             # Simpan detail ke pph21_info
-            self.pph21_info = json.dumps(result)
+            self._set_pph21_info(result)
 
             # Pastikan baris PPh21 di deductions ter-update
             self.update_pph21_row(tax_amount)
 
             # (Opsional) log audit
-            frappe.logger().info(
-                f"[DEC] {self.name} bruto_des={bruto_desember} bj_month={biaya_jabatan_desember} "
-                f"jp_jht_month={jp_jht_employee_month} ytd_pph={ytd_tax_paid_jan_nov} -> tax_dec={tax_amount}"
+            logger.debug(
+                "[DEC] %s bruto_des=%s bj_month=%s jp_jht_month=%s ytd_pph=%s -> tax_dec=%s",
+                self.name, bruto_desember, biaya_jabatan_desember,
+                jp_jht_employee_month, ytd_tax_paid_jan_nov, tax_amount,
             )
             return tax_amount
 
@@ -293,6 +444,47 @@ class CustomSalarySlip(SalarySlip):
     # -------------------------
     # Utilitas lain
     # -------------------------
+    def _as_tax_dict(self):
+        """
+        Dict ringkas untuk perhitungan Desember: hanya identitas, tanggal dan
+        baris earnings/deductions, tanpa serialisasi seluruh field slip.
+        """
+        def rows(table):
+            return [
+                r if isinstance(r, dict) else r.as_dict()
+                for r in (getattr(self, table, None) or [])
+            ]
+
+        return {
+            "name": getattr(self, "name", None),
+            "start_date": getattr(self, "start_date", None),
+            "earnings": rows("earnings"),
+            "deductions": rows("deductions"),
+        }
+
+    def _set_pph21_info(self, result):
+        """
+        Tulis pph21_info; hasil yang sama dengan serialisasi terakhir tidak
+        di-serialize ulang (validate berulang pada slip yang tidak berubah).
+        """
+        cached = getattr(self, "_pph21_info_cache", None)
+        if cached is not None and cached[1] == result and getattr(self, "pph21_info", None) == cached[0]:
+            return
+        info_json = _dumps_pph21_info(result)
+        self.pph21_info = info_json
+        self._pph21_info_cache = (info_json, result)
+
+    def _get_pph21_info(self):
+        """Dict pph21_info; hasil perhitungan di request yang sama dipakai tanpa json.loads."""
+        info_json = getattr(self, "pph21_info", None)
+        cached = getattr(self, "_pph21_info_cache", None)
+        if cached is not None and info_json == cached[0]:
+            return cached[1]
+        try:
+            return json.loads(info_json or "{}")
+        except Exception:
+            return {}
+
     def _calculate_taxable_income(self):
         return {
             "earnings": getattr(self, "earnings", []),
@@ -306,8 +498,10 @@ class CustomSalarySlip(SalarySlip):
             target = "PPh 21"
             found = False
             for d in self.deductions:
-                sc = d.get("salary_component") if isinstance(d, dict) else getattr(d, "salary_component", None)
-                if sc == target:
+                if _row_value(d, "salary_component") == target:
+                    # Nominal sama (selisih < pembulatan rupiah): total dari validate induk masih valid
+                    if abs(flt(_row_value(d, "amount", 0)) - flt(tax_amount)) < 0.005:
+                        return
                     if isinstance(d, dict):
                         d["amount"] = tax_amount
                     else:
@@ -324,14 +518,25 @@ class CustomSalarySlip(SalarySlip):
             )
             raise frappe.ValidationError(f"Error updating PPh21 component: {e}")
 
+    @classmethod
+    def _get_totals_method(cls):
+        """Nama method total bawaan HRMS; diperiksa sekali per class, bukan per slip."""
+        if "_totals_method" not in cls.__dict__:
+            cls._totals_method = next(
+                (
+                    name
+                    for name in ("set_totals", "calculate_totals", "calculate_net_pay")
+                    if callable(getattr(cls, name, None))
+                ),
+                None,
+            )
+        return cls._totals_method
+
     def _recalculate_totals(self):
         try:
-            if hasattr(self, "set_totals") and callable(getattr(self, "set_totals")):
-                self.set_totals()
-            elif hasattr(self, "calculate_totals") and callable(getattr(self, "calculate_totals")):
-                self.calculate_totals()
-            elif hasattr(self, "calculate_net_pay") and callable(getattr(self, "calculate_net_pay")):
-                self.calculate_net_pay()
+            method = self._get_totals_method()
+            if method:
+                getattr(self, method)()
             else:
                 self._manual_totals_calculation()
             self._update_rounded_values()
@@ -341,17 +546,14 @@ class CustomSalarySlip(SalarySlip):
             self._update_rounded_values()
 
     def _manual_totals_calculation(self):
-        def row_amount(row):
-            return row.get("amount", 0) if isinstance(row, dict) else getattr(row, "amount", 0)
-
-        def flag(row, name):
-            return (row.get(name, 0) if isinstance(row, dict) else getattr(row, name, 0)) or 0
-
         def include(row):
-            return not (flag(row, "do_not_include_in_total") or flag(row, "statistical_component"))
+            return not (
+                _row_value(row, "do_not_include_in_total", 0)
+                or _row_value(row, "statistical_component", 0)
+            )
 
-        self.gross_pay = sum(row_amount(r) for r in (self.earnings or []) if include(r))
-        self.total_deduction = sum(row_amount(r) for r in (self.deductions or []) if include(r))
+        self.gross_pay = sum(_row_value(r, "amount", 0) for r in (self.earnings or []) if include(r))
+        self.total_deduction = sum(_row_value(r, "amount", 0) for r in (self.deductions or []) if include(r))
         self.net_pay = (self.gross_pay or 0) - (self.total_deduction or 0)
         if hasattr(self, "total"):
             self.total = self.net_pay
@@ -362,9 +564,8 @@ class CustomSalarySlip(SalarySlip):
                 self.rounded_total = round(getattr(self, "total", self.net_pay))
             if hasattr(self, "rounded_net_pay"):
                 self.rounded_net_pay = round(self.net_pay)
-            if hasattr(self, "net_pay_in_words"):
+            if hasattr(self, "net_pay_in_words") and money_in_words:
                 try:
-                    from frappe.utils import money_in_words
                     self.net_pay_in_words = money_in_words(self.net_pay, getattr(self, "currency", "IDR"))
                 except Exception:
                     pass
@@ -391,8 +592,8 @@ class CustomSalarySlip(SalarySlip):
             else:
                 tax_amount = self.calculate_income_tax()
 
-            self.update_pph21_row(tax_amount)
-            logger.info(f"Validate: Updated PPh21 deduction row to {tax_amount}")
+            # Baris PPh21 & total sudah diperbarui di dalam calculate_income_tax*
+            logger.debug("Validate: Updated PPh21 deduction row to %s", tax_amount)
 
         except frappe.ValidationError:
             raise
@@ -424,17 +625,22 @@ class CustomSalarySlip(SalarySlip):
                 "employee_name": employee_doc.get("employee_name"),
             }
 
-            fiscal_year = getattr(self, "fiscal_year", None)
-            if not fiscal_year and getattr(self, "start_date", None):
-                fiscal_year = str(getdate(self.start_date).year)
+            # start_date di-parse sekali untuk tahun fiskal dan nomor bulan
+            start_date = getattr(self, "start_date", None)
+            try:
+                periode = getdate(start_date) if start_date else None
+            except Exception:
+                periode = None
+
+            fiscal_year = self._get_fiscal_year(periode)
             if not fiscal_year:
                 logger.warning(f"Could not determine fiscal year for Salary Slip {self.name}, skipping sync")
                 return
 
-            nomor_bulan = self._get_bulan_number(
-                start_date=getattr(self, "start_date", None),
-                nama_bulan=getattr(self, "bulan", None),
-            )
+            if periode:
+                nomor_bulan = periode.month
+            else:
+                nomor_bulan = self._get_bulan_number(nama_bulan=getattr(self, "bulan", None))
 
             raw_rate = result.get("rate", 0)
             numeric_rate = raw_rate if isinstance(raw_rate, (int, float)) else 0
@@ -451,11 +657,8 @@ class CustomSalarySlip(SalarySlip):
                 "salary_slip": self.name,
             }
 
-            if mode == "monthly":
-                sync_annual_payroll_history(
-                    employee=employee_info, fiscal_year=fiscal_year, monthly_results=[monthly_result], summary=None
-                )
-            elif mode == "december":
+            summary = None
+            if mode == "december":
                 summary = {
                     "bruto_total": result.get("bruto_total", 0),
                     "netto_total": result.get("netto_total", 0),
@@ -466,9 +669,16 @@ class CustomSalarySlip(SalarySlip):
                 }
                 if isinstance(raw_rate, str) and raw_rate:
                     summary["rate_slab"] = raw_rate
-                sync_annual_payroll_history(
-                    employee=employee_info, fiscal_year=fiscal_year, monthly_results=[monthly_result], summary=summary
-                )
+
+            if mode in ("monthly", "december"):
+                # Saat Payroll Entry berjalan, APH ditulis sekali per karyawan di akhir batch
+                deferred = get_deferred_sync_buffer()
+                if deferred is not None:
+                    deferred.append((employee_info, fiscal_year, monthly_result, summary))
+                else:
+                    sync_annual_payroll_history(
+                        employee=employee_info, fiscal_year=fiscal_year, monthly_results=[monthly_result], summary=summary
+                    )
 
             self._annual_history_synced = True
 
@@ -482,10 +692,7 @@ class CustomSalarySlip(SalarySlip):
             logger.warning(f"Annual Payroll History sync failed for {self.name}: {e}")
 
     def on_submit(self):
-        try:
-            info = json.loads(getattr(self, "pph21_info", "{}") or "{}")
-        except Exception:
-            info = {}
+        info = self._get_pph21_info()
         tax_type = getattr(self, "tax_type", None) or info.get("_tax_type")
         if not tax_type:
             bulan = self._get_bulan_number(start_date=getattr(self, "start_date", None))
@@ -504,15 +711,12 @@ class CustomSalarySlip(SalarySlip):
                 logger.warning(f"No employee for cancelled Salary Slip {getattr(self, 'name', 'unknown')}, skip")
                 return
 
-            fiscal_year = getattr(self, "fiscal_year", None) or str(getattr(self, "start_date", ""))[:4]
+            fiscal_year = self._get_fiscal_year()
             if not fiscal_year:
                 logger.warning(f"Could not determine fiscal year for cancelled Salary Slip {self.name}, skipping sync")
                 return
 
-            try:
-                info = json.loads(getattr(self, "pph21_info", "{}") or "{}")
-            except Exception:
-                info = {}
+            info = self._get_pph21_info()
 
             tax_type = getattr(self, "tax_type", None) or info.get("_tax_type")
             if not tax_type:
@@ -0,0 +1,12 @@
+from payroll_indonesia.payroll_indonesia.doctype.annual_payroll_history import (
+    annual_payroll_history,
+)
+from payroll_indonesia.payroll_indonesia.doctype.annual_payroll_history_child import (
+    annual_payroll_history_child,
+)
+
+
+def execute():
+    """Add the Annual Payroll History indexes on sites installed before on_doctype_update had them."""
+    annual_payroll_history.on_doctype_update()
+    annual_payroll_history_child.on_doctype_update()
@@ -1,10 +1,16 @@
 import json
 import re
+from datetime import date
 
 import frappe
 from frappe.utils import flt, getdate
 from frappe.model.document import Document
 
+def on_doctype_update():
+    # get_or_create_annual_payroll_history and the December YTD lookup
+    frappe.db.add_index("Annual Payroll History", ["employee", "fiscal_year"])
+
+
 class AnnualPayrollHistory(Document):
     def validate(self):
         """
@@ -93,67 +99,71 @@ class AnnualPayrollHistory(Document):
             logger.info(f"No salary slips found for {self.name}")
             return
 
-        slip_docs = []
+        # Read the fields needed for ordering in one query; full documents are
+        # only loaded right before each cancellation
+        rows = frappe.get_all(
+            "Salary Slip",
+            filters={"name": ["in", slips]},
+            fields=["name", "docstatus", "posting_date", "start_date", "tax_type", "pph21_info"],
+        )
+        found = {row.name for row in rows}
         for slip_name in slips:
-            try:
-                doc = frappe.get_doc("Salary Slip", slip_name)
-                slip_docs.append(doc)
-                logger.info(f"Queued Salary Slip {slip_name} for cancellation")
-            except Exception as e:
-                logger.error(f"Unable to retrieve Salary Slip {slip_name}: {e}")
+            if slip_name not in found:
+                logger.error(f"Unable to retrieve Salary Slip {slip_name}: not found")
 
-        # Separate December slips and others
+        # Separate December slips and others, parsing each slip period once
         december_slips, other_slips = [], []
-        for doc in slip_docs:
-            posting_date = getattr(doc, "posting_date", None)
-            start_date = getattr(doc, "start_date", None)
+        failed = []
+        for row in rows:
+            if row.docstatus != 1:
+                # Draft or already cancelled slips cannot be cancelled
+                failed.append(row.name)
+                logger.error(f"Failed to cancel Salary Slip {row.name}: docstatus is {row.docstatus}")
+                continue
+            logger.info(f"Queued Salary Slip {row.name} for cancellation")
+
             # Determine month using posting_date, fallback to start_date
-            month_source = posting_date or start_date
-            month = getdate(month_source).month if month_source else None
+            month_source = getattr(row, "posting_date", None) or getattr(row, "start_date", None)
+            period = getdate(month_source) if month_source else date.min
+            month = period.month if month_source else None
 
-            tax_type = getattr(doc, "tax_type", None)
+            tax_type = getattr(row, "tax_type", None)
             if not tax_type:
-                info_json = getattr(doc, "pph21_info", None)
+                info_json = getattr(row, "pph21_info", None)
                 if info_json:
                     try:
                         info = json.loads(info_json)
                         tax_type = info.get("_tax_type")
                     except Exception as e:
-                        logger.error(f"Error parsing pph21_info for {doc.name}: {e}")
+                        logger.error(f"Error parsing pph21_info for {row.name}: {e}")
 
             if tax_type == "DECEMBER" or month == 12:
-                december_slips.append(doc)
+                december_slips.append((period, row.name))
             else:
-                other_slips.append(doc)
+                other_slips.append((period, row.name))
 
         # Sort processing order: December first, then others from latest to oldest
-        december_slips.sort(
-            key=lambda d: getattr(d, "posting_date", None)
-            or getattr(d, "start_date", None),
-            reverse=True,
-        )
-        other_slips.sort(
-            key=lambda d: getattr(d, "posting_date", None)
-            or getattr(d, "start_date", None),
-            reverse=True,
-        )
-        slip_docs = december_slips + other_slips
-
-        cancelled, failed = [], []
-        for slip in slip_docs:
-            savepoint = re.sub(r"\W+", "_", f"cancel_{slip.name}")[:63]
+        december_slips.sort(key=lambda item: item[0], reverse=True)
+        other_slips.sort(key=lambda item: item[0], reverse=True)
+        ordered_slips = [name for _, name in december_slips + other_slips]
+
+        # Each slip is isolated by its own savepoint; the cancellations are
+        # committed together with this document by the surrounding request
+        cancelled = []
+        for slip_name in ordered_slips:
+            savepoint = re.sub(r"\W+", "_", f"cancel_{slip_name}")[:63]
             try:
                 frappe.db.savepoint(savepoint)
-                logger.info(f"Cancelling Salary Slip {slip.name}")
+                logger.info(f"Cancelling Salary Slip {slip_name}")
+                slip = frappe.get_doc("Salary Slip", slip_name)
                 slip.flags.from_annual_payroll_cancel = True
                 slip.cancel()
-                frappe.db.commit()
-                cancelled.append(slip.name)
-                logger.info(f"Cancelled Salary Slip {slip.name}")
+                cancelled.append(slip_name)
+                logger.info(f"Cancelled Salary Slip {slip_name}")
             except Exception as e:
                 frappe.db.rollback(save_point=savepoint)
-                failed.append(slip.name)
-                logger.error(f"Failed to cancel Salary Slip {slip.name}: {e}")
+                failed.append(slip_name)
+                logger.error(f"Failed to cancel Salary Slip {slip_name}: {e}")
 
         summary = []
         if cancelled:
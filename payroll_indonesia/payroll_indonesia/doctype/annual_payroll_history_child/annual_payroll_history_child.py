@@ -2,5 +2,10 @@ import frappe
 from frappe.model.document import Document
 
 
+def on_doctype_update():
+    # Monthly detail removal and validation by salary slip
+    frappe.db.add_index("Annual Payroll History Child", ["salary_slip"])
+
+
 class AnnualPayrollHistoryChild(Document):
-    pass
\ No newline at end of file
+    pass
@@ -1,7 +1,12 @@
 from frappe.model.document import Document
 
+from payroll_indonesia.config import clear_ptkp_cache, clear_ter_rate_cache
+
 
 class PayrollIndonesiaSettings(Document):
     """Settings for Payroll Indonesia (BPJS/PPh21)."""
 
-    pass
+    def on_update(self):
+        # PTKP, TER Mapping and TER Bracket rows are edited through this document
+        clear_ptkp_cache()
+        clear_ter_rate_cache()
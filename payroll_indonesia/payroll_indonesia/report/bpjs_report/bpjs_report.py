@@ -185,8 +185,11 @@ def get_report_data(filters):
         "total_employee": 0
     }
     
+    # Fetch BPJS details of all slips at once instead of one query per slip
+    components_map = get_bpjs_components_map([slip.name for slip in salary_slips])
+
     for slip in salary_slips:
-        row = process_salary_slip_bpjs(slip)
+        row = process_salary_slip_bpjs(slip, components_map.get(slip.name))
         if row:
             data.append(row)
             
@@ -237,15 +240,16 @@ def get_conditions(filters):
     return " AND ".join(conditions)
 
 
-def process_salary_slip_bpjs(slip):
+def process_salary_slip_bpjs(slip, bpjs_components=None):
     """
     Extract and calculate BPJS information from a salary slip
     """
     if not slip:
         return None
     
-    # Get BPJS components from the slip
-    bpjs_components = get_bpjs_components(slip.name)
+    # Get BPJS components from the slip unless already fetched in bulk
+    if bpjs_components is None:
+        bpjs_components = get_bpjs_components(slip.name)
     
     if not any(bpjs_components.values()):
         return None
@@ -287,6 +291,40 @@ def get_bpjs_components(salary_slip_name):
     """
     Fetch all BPJS-related components for a salary slip
     """
+    return get_bpjs_components_map([salary_slip_name])[salary_slip_name]
+
+
+def get_bpjs_components_map(salary_slip_names):
+    """
+    Fetch BPJS-related components of many salary slips with a single query,
+    grouped as {slip_name: components}
+    """
+    details_by_slip = {name: [] for name in salary_slip_names}
+    if salary_slip_names:
+        salary_details = frappe.db.sql(
+            """
+            SELECT sd.parent, sd.salary_component, sd.amount, sd.parentfield
+            FROM `tabSalary Detail` sd
+            WHERE sd.parent IN %(names)s
+            AND sd.salary_component LIKE '%%BPJS%%'
+            AND sd.salary_component NOT LIKE '%%Contra%%'
+            """,
+            {"names": tuple(salary_slip_names)},
+            as_dict=1
+        )
+        for detail in salary_details:
+            details_by_slip[detail.parent].append(detail)
+
+    return {
+        name: categorize_bpjs_details(details)
+        for name, details in details_by_slip.items()
+    }
+
+
+def categorize_bpjs_details(salary_details):
+    """
+    Categorize BPJS salary details of one salary slip into report columns
+    """
     components = {
         "bpjs_kesehatan_employer": 0,
         "bpjs_kesehatan_employee": 0,
@@ -298,19 +336,6 @@ def get_bpjs_components(salary_slip_name):
         "bpjs_jkm": 0
     }
     
-    # Get all salary details for the salary slip
-    salary_details = frappe.db.sql(
-        """
-        SELECT sd.salary_component, sd.amount, sd.parentfield
-        FROM `tabSalary Detail` sd
-        WHERE sd.parent = %s 
-        AND sd.salary_component LIKE '%%BPJS%%'
-        AND sd.salary_component NOT LIKE '%%Contra%%'
-        """,
-        (salary_slip_name),
-        as_dict=1
-    )
-    
     # Process each component and categorize it
     for detail in salary_details:
         component_name = detail.get("salary_component", "").lower()
@@ -153,10 +153,13 @@ def get_report_data(filters):
     if not salary_slips:
         return []
     
+    # Fetch components of all slips at once instead of two queries per slip
+    components_map = get_salary_slip_components_map([slip.name for slip in salary_slips])
+
     # Process salary slips to extract PPh21 data
     data = []
     for slip in salary_slips:
-        row = process_salary_slip(slip)
+        row = process_salary_slip(slip, components_map.get(slip.name))
         if row:
             data.append(row)
     
@@ -230,7 +233,7 @@ def get_conditions(filters):
     return " AND ".join(conditions)
 
 
-def process_salary_slip(slip):
+def process_salary_slip(slip, components=None):
     """
     Extract and calculate PPh21 information from a salary slip
     """
@@ -245,8 +248,9 @@ def process_salary_slip(slip):
         except (ValueError, TypeError):
             frappe.logger().error(f"Invalid PPh21 info JSON in Salary Slip {slip.name}")
     
-    # Get components from the slip
-    components = get_salary_slip_components(slip.name)
+    # Get components from the slip unless already fetched in bulk
+    if components is None:
+        components = get_salary_slip_components(slip.name)
     
     bpjs_deductions = sum_bpjs_deductions(components)
     other_deductions = sum_other_deductions(components)
@@ -291,39 +295,41 @@ def get_salary_slip_components(salary_slip_name):
     """
     Fetch all components (earnings and deductions) for a salary slip
     """
-    components = {}
-    
-    # Get earnings components
-    earnings = frappe.db.sql(
-        """
-        SELECT sd.salary_component, sd.amount, sc.type, sc.is_tax_applicable, 
-               sc.statistical_component, sc.do_not_include_in_total,
-               sc.is_income_tax_component
-        FROM `tabSalary Detail` sd
-        LEFT JOIN `tabSalary Component` sc ON sd.salary_component = sc.name
-        WHERE sd.parent = %s AND sd.parentfield = 'earnings'
-        """,
-        (salary_slip_name),
-        as_dict=1
+    return get_salary_slip_components_map([salary_slip_name]).get(
+        salary_slip_name, {"earnings": [], "deductions": []}
     )
-    
-    # Get deductions components
-    deductions = frappe.db.sql(
+
+
+def get_salary_slip_components_map(salary_slip_names):
+    """
+    Fetch earnings and deductions of many salary slips with a single query,
+    grouped as {slip_name: {"earnings": [...], "deductions": [...]}}
+    """
+    components_map = {
+        name: {"earnings": [], "deductions": []} for name in salary_slip_names
+    }
+    if not salary_slip_names:
+        return components_map
+
+    details = frappe.db.sql(
         """
-        SELECT sd.salary_component, sd.amount, sc.type, sc.statistical_component,
+        SELECT sd.parent, sd.parentfield, sd.salary_component, sd.amount, sc.type,
+               sc.is_tax_applicable, sc.statistical_component,
                sc.do_not_include_in_total, sc.is_income_tax_component
         FROM `tabSalary Detail` sd
         LEFT JOIN `tabSalary Component` sc ON sd.salary_component = sc.name
-        WHERE sd.parent = %s AND sd.parentfield = 'deductions'
+        WHERE sd.parent IN %(names)s
+        AND sd.parentfield IN ('earnings', 'deductions')
+        ORDER BY sd.parent, sd.idx
         """,
-        (salary_slip_name),
+        {"names": tuple(salary_slip_names)},
         as_dict=1
     )
-    
-    components["earnings"] = earnings
-    components["deductions"] = deductions
-    
-    return components
+
+    for detail in details:
+        components_map[detail.pop("parent")][detail.pop("parentfield")].append(detail)
+
+    return components_map
 
 
 def sum_bpjs_deductions(components):
@@ -1,9 +1,9 @@
-import json
-import os
-from typing import Dict
+from typing import Dict, List, Optional
 
 import frappe
 
+from .settings_migration import load_json as load_setup_json
+
 
 def load_json(filename: str) -> Dict[str, str]:
     """
@@ -15,21 +15,29 @@ def load_json(filename: str) -> Dict[str, str]:
     Returns:
         Dictionary from the JSON file or empty dict if file not found
     """
-    file_path = frappe.get_app_path("payroll_indonesia", "setup", filename)
-    
-    if not os.path.exists(file_path):
-        frappe.logger().warning(f"File not found: {file_path}")
-        return {}
-    
+    return load_setup_json(filename) or {}
+
+
+def get_companies() -> List[Dict[str, str]]:
+    """
+    Return ``name`` and ``abbr`` of every Company with a single SELECT.
+
+    Setup runs in a trusted migrate context, so the permission layer and
+    metadata loading done by ``frappe.get_all`` are skipped.
+
+    Returns:
+        List of company rows, or an empty list if the table is not ready
+    """
     try:
-        with open(file_path, "r") as f:
-            return json.load(f)
+        return frappe.db.sql("SELECT name, abbr FROM `tabCompany`", as_dict=True)
     except Exception as e:
-        frappe.logger().warning(f"Error loading {filename}: {str(e)}")
-        return {}
+        frappe.logger().warning("Unable to read companies: %s", e)
+        return []
 
 
-def assign_gl_accounts_to_salary_components(company: str, company_abbr: str) -> None:
+def assign_gl_accounts_to_salary_components(
+    company: str, company_abbr: str, mapping: Optional[Dict[str, str]] = None
+) -> None:
     """
     Assign GL accounts to salary components based on mapping defined in gl_account_mapping.json
     using the Salary Component Account child table.
@@ -37,14 +45,15 @@ def assign_gl_accounts_to_salary_components(company: str, company_abbr: str) ->
     Args:
         company: Name of the company
         company_abbr: Company abbreviation used in account names
+        mapping: Preloaded component-to-account mapping (read from file if omitted)
     """
-    # Load mapping from JSON file
-    mapping = load_json("gl_account_mapping.json")
+    if mapping is None:
+        mapping = load_json("gl_account_mapping.json")
     if not mapping:
         frappe.logger().warning("GL account mapping not found or empty. Skipping assignment.")
         return
     
-    frappe.logger().info(f"Processing GL account mapping for company: {company}")
+    frappe.logger().info("Processing GL account mapping for company: %s", company)
     
     # Process each mapping entry
     for component_name, account_name in mapping.items():
@@ -53,7 +62,7 @@ def assign_gl_accounts_to_salary_components(company: str, company_abbr: str) ->
         
         # Check if account exists
         if not frappe.db.exists("Account", full_acc):
-            frappe.logger().warning(f"Account {full_acc} not found for company {company}. Skipping.")
+            frappe.logger().warning("Account %s not found for company %s. Skipping.", full_acc, company)
             continue
         
         # Find salary components to update
@@ -64,7 +73,7 @@ def assign_gl_accounts_to_salary_components(company: str, company_abbr: str) ->
         )
         
         if not salary_components:
-            frappe.logger().info(f"No salary component found with name '{component_name}'. Skipping.")
+            frappe.logger().debug("No salary component found with name '%s'. Skipping.", component_name)
             continue
         
         # Update each salary component
@@ -81,16 +90,16 @@ def assign_gl_accounts_to_salary_components(company: str, company_abbr: str) ->
             if existing_mapping:
                 # Update if account is different
                 if existing_mapping.account != full_acc:
-                    frappe.logger().info(
-                        f"Updating account for '{component_name}' in company '{company}' "
-                        f"from '{existing_mapping.account}' to '{full_acc}'"
+                    frappe.logger().debug(
+                        "Updating account for '%s' in company '%s' from '%s' to '%s'",
+                        component_name, company, existing_mapping.account, full_acc,
                     )
                     existing_mapping.account = full_acc
                     sc_doc.save()
                 else:
-                    frappe.logger().info(
-                        f"Salary component '{component_name}' already mapped to '{full_acc}' "
-                        f"for company '{company}'. Skipping."
+                    frappe.logger().debug(
+                        "Salary component '%s' already mapped to '%s' for company '%s'. Skipping.",
+                        component_name, full_acc, company,
                     )
             else:
                 # Create new mapping
@@ -100,24 +109,29 @@ def assign_gl_accounts_to_salary_components(company: str, company_abbr: str) ->
                         "account": full_acc,
                     })
                     sc_doc.save()
-                    frappe.logger().info(
-                        f"Mapped salary component '{component_name}' to GL account '{full_acc}' "
-                        f"for company '{company}'"
+                    frappe.logger().debug(
+                        "Mapped salary component '%s' to GL account '%s' for company '%s'",
+                        component_name, full_acc, company,
                     )
                 except Exception as e:
                     frappe.logger().warning(
-                        f"Error mapping '{component_name}' to '{full_acc}' for company '{company}': {str(e)}"
+                        "Error mapping '%s' to '%s' for company '%s': %s",
+                        component_name, full_acc, company, e,
                     )
 
 
-def create_default_mapping_for_component(component_name: str) -> None:
+def create_default_mapping_for_component(
+    component_name: str, mapping: Optional[Dict[str, str]] = None
+) -> None:
     """
     Create default account mapping (without company) for a salary component.
     
     Args:
         component_name: Name of the salary component
+        mapping: Preloaded component-to-account mapping (read from file if omitted)
     """
-    mapping = load_json("gl_account_mapping.json")
+    if mapping is None:
+        mapping = load_json("gl_account_mapping.json")
     if not mapping or component_name not in mapping:
         return
     
@@ -138,34 +152,52 @@ def create_default_mapping_for_component(component_name: str) -> None:
             "default_account": 1
         })
         sc_doc.save()
-        frappe.logger().info(f"Created default mapping for '{component_name}' to '{account_name}'")
+        frappe.logger().debug("Created default mapping for '%s' to '%s'", component_name, account_name)
 
 
 @frappe.whitelist()
-def assign_gl_accounts_to_salary_components_all() -> None:
+def assign_gl_accounts_to_salary_components_all(autocommit: bool = True) -> None:
     """
     Assign GL accounts to salary components for all companies.
     This function can be called from the command line.
+    
+    Args:
+        autocommit: Commit once all companies are processed. Setup passes False
+            so the mapping shares the caller's transaction.
     """
-    companies = frappe.get_all("Company", fields=["name", "abbr"])
+    companies = get_companies()
     mapping = load_json("gl_account_mapping.json")
     
+    existing = set()
+    if mapping:
+        existing = set(
+            frappe.get_all(
+                "Salary Component",
+                filters={"salary_component": ["in", list(mapping)]},
+                pluck="salary_component",
+            )
+        )
+    
     # First create default mappings for all components
     for component_name in mapping:
         try:
-            if frappe.db.exists("Salary Component", {"salary_component": component_name}):
-                create_default_mapping_for_component(component_name)
+            if component_name in existing:
+                create_default_mapping_for_component(component_name, mapping)
         except Exception as e:
-            frappe.logger().warning(f"Error creating default mapping for {component_name}: {str(e)}")
+            frappe.logger().warning("Error creating default mapping for %s: %s", component_name, e)
     
-    # Then create company-specific mappings
-    for company in companies:
+    # Then create company-specific mappings, isolating each company with a savepoint
+    for idx, company in enumerate(companies):
+        savepoint = f"gl_account_mapping_{idx}"
+        frappe.db.savepoint(savepoint)
         try:
-            assign_gl_accounts_to_salary_components(company.name, company.abbr)
-            frappe.db.commit()
-            frappe.logger().info(f"Completed GL account mapping for company: {company.name}")
+            assign_gl_accounts_to_salary_components(company.name, company.abbr, mapping)
+            frappe.logger().info("Completed GL account mapping for company: %s", company.name)
         except Exception as e:
-            frappe.logger().warning(f"Error processing company {company.name}: {str(e)}")
-            frappe.db.rollback()
+            frappe.logger().warning("Error processing company %s: %s", company.name, e)
+            frappe.db.rollback(save_point=savepoint)
+    
+    if autocommit:
+        frappe.db.commit()
     
     frappe.logger().info("Completed GL account mapping for all companies")
@@ -4,23 +4,181 @@ from typing import Any, Optional
 
 import frappe
 from frappe.model.document import Document
+from frappe.utils import now
+
+from payroll_indonesia.config import clear_ptkp_cache, clear_ter_rate_cache
+
+SETTINGS_DOCTYPE = "Payroll Indonesia Settings"
+
+# Bump whenever default_ptkp_table.json, default_ter_mapping.json or
+# default_ter_rate.json change so the next migrate re-imports them.
+FIXTURES_VERSION = "2026-10"
+
+# Initial values for a freshly created Payroll Indonesia Settings document
+DEFAULT_SETTINGS_VALUES = (
+    ("pph21_method", "TER"),
+    ("validate_tax_status_strict", 1),
+    ("salary_slip_use_component_cache", 1),
+    ("auto_queue_salary_slip", 0),
+    ("bpjs_health_employer_rate", 4.0),
+    ("bpjs_health_employer_cap", 12000000),
+    ("bpjs_health_employee_rate", 1.0),
+    ("bpjs_health_employee_cap", 12000000),
+    ("bpjs_jht_employer_rate", 3.7),
+    ("bpjs_jht_employer_cap", 9077600),
+    ("bpjs_jht_employee_rate", 2.0),
+    ("bpjs_jht_employee_cap", 9077600),
+    ("bpjs_jkk_rate", 0.24),
+    ("bpjs_jkk_cap", 9077600),
+    ("bpjs_jkm_rate", 0.3),
+    ("bpjs_jkm_cap", 9077600),
+    ("bpjs_pension_employer_rate", 2.0),
+    ("bpjs_pension_employer_cap", 9077600),
+    ("bpjs_pension_employee_rate", 1.0),
+    ("bpjs_pension_employee_cap", 9077600),
+    ("biaya_jabatan_rate", 5.0),
+    ("biaya_jabatan_cap", 6000000),
+    ("fallback_income_tax_slab", None),
+)
+
+# Parsed setup files keyed by path, stored with the file mtime they were read at
+_JSON_CACHE: dict[str, tuple[int, Any]] = {}
 
 def load_json(filename: str) -> Any:
     """
     Load a JSON file from the setup directory.
+    The parsed content is cached until the file's mtime changes, so callers
+    must treat the returned object as read-only.
     """
     file_path = frappe.get_app_path("payroll_indonesia", "setup", filename)
-    if not os.path.exists(file_path):
-        frappe.logger().warning(f"File not found: {file_path}")
+    try:
+        mtime = os.stat(file_path).st_mtime_ns
+    except OSError:
+        frappe.logger().warning("File not found: %s", file_path)
         return None
+
+    cached = _JSON_CACHE.get(file_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
     try:
         with open(file_path, "r") as f:
-            return json.load(f)
+            data = json.load(f)
     except Exception as e:
-        frappe.logger().warning(f"Error loading {filename}: {str(e)}")
+        frappe.logger().warning("Error loading %s: %s", filename, e)
         return None
 
-def import_ptkp_table_to_doctype() -> None:
+    _JSON_CACHE[file_path] = (mtime, data)
+    return data
+
+def _settings_child_values(
+    parentfield: str, rows: list[dict], names: list[str]
+) -> tuple[list[str], list[tuple]]:
+    """Build column names and value tuples for Payroll Indonesia Settings child rows."""
+    timestamp = now()
+    user = frappe.session.user
+    value_fields = list(rows[0])
+    fields = [
+        "name", "parent", "parenttype", "parentfield", "idx",
+        "creation", "modified", "owner", "modified_by", "docstatus",
+        *value_fields,
+    ]
+    values = [
+        (
+            name, SETTINGS_DOCTYPE, SETTINGS_DOCTYPE, parentfield, idx,
+            timestamp, timestamp, user, user, 0,
+            *(row[field] for field in value_fields),
+        )
+        for idx, (name, row) in enumerate(zip(names, rows), start=1)
+    ]
+    return fields, values
+
+def bulk_insert_settings_rows(child_doctype: str, parentfield: str, rows: list[dict]) -> None:
+    """
+    Insert seed rows for a Payroll Indonesia Settings child table in one statement.
+    Rows must share the same keys; document hooks are skipped.
+    """
+    if not rows:
+        return
+
+    generate_hash = frappe.generate_hash
+    names = [generate_hash(length=10) for _ in rows]
+    fields, values = _settings_child_values(parentfield, rows, names)
+    frappe.db.bulk_insert(child_doctype, fields, values, chunk_size=1000)
+    frappe.clear_document_cache(SETTINGS_DOCTYPE, SETTINGS_DOCTYPE)
+
+def upsert_settings_rows(
+    child_doctype: str,
+    parentfield: str,
+    rows: list[dict],
+    names: list[str],
+    update_fields: tuple[str, ...],
+    chunk_size: int = 1000,
+) -> None:
+    """
+    Upsert seed rows keyed by deterministic ``names`` and drop rows no longer present.
+    Existing rows keep their ``creation``; ``update_fields`` are overwritten.
+    """
+    if not rows:
+        return
+
+    fields, values = _settings_child_values(parentfield, rows, names)
+    columns = ", ".join(f"`{field}`" for field in fields)
+    placeholder = "(" + ", ".join(["%s"] * len(fields)) + ")"
+    updates = ", ".join(
+        f"`{field}` = VALUES(`{field}`)" for field in ("idx", "modified", "modified_by", *update_fields)
+    )
+
+    for start in range(0, len(values), chunk_size):
+        batch = values[start:start + chunk_size]
+        frappe.db.sql(
+            f"INSERT INTO `tab{child_doctype}` ({columns}) "
+            f"VALUES {', '.join([placeholder] * len(batch))} "
+            f"ON DUPLICATE KEY UPDATE {updates}",
+            [value for row in batch for value in row],
+        )
+
+    frappe.db.sql(
+        f"DELETE FROM `tab{child_doctype}` WHERE parentfield = %s AND name NOT IN %s",
+        (parentfield, tuple(names)),
+    )
+    frappe.clear_document_cache(SETTINGS_DOCTYPE, SETTINGS_DOCTYPE)
+
+def settings_rows_unchanged(child_doctype: str, rows: list[dict]) -> bool:
+    """
+    Return True if ``child_doctype`` already holds exactly ``rows`` in order.
+    Numbers are compared as floats so Currency/Float columns match the JSON values.
+    """
+    if not rows:
+        return False
+
+    def normalize(values) -> tuple:
+        return tuple(float(v) if isinstance(v, (int, float)) else v for v in values)
+
+    fields = list(rows[0])
+    columns = ", ".join(f"`{field}`" for field in fields)
+    current = frappe.db.sql(f"SELECT {columns} FROM `tab{child_doctype}` ORDER BY idx")
+    return [normalize(row) for row in current] == [
+        normalize(row[field] for field in fields) for row in rows
+    ]
+
+def normalize_ter_brackets(ter_rate_data: list) -> list[dict]:
+    """
+    Flatten default_ter_rate.json into bracket rows with numeric values cast once.
+    An open-ended ``max_income`` (None) is stored as 0.
+    """
+    return [
+        {
+            "ter_code": ter_code_data["ter_code"],
+            "min_income": float(bracket["min_income"] or 0),
+            "max_income": float(bracket["max_income"] or 0),
+            "rate_percent": float(bracket["rate_percent"] or 0),
+        }
+        for ter_code_data in ter_rate_data
+        for bracket in ter_code_data["brackets"]
+    ]
+
+def import_ptkp_table_to_doctype(settings_checked: bool = False) -> None:
     """
     Import default PTKP values into PTKP Table DocType.
     """
@@ -29,24 +187,23 @@ def import_ptkp_table_to_doctype() -> None:
         frappe.logger().warning("PTKP data not found or invalid format")
         return
 
+    rows = [
+        {"tax_status": entry["tax_status"], "ptkp_amount": entry["ptkp_amount"]}
+        for entry in ptkp_data[0]["ptkp_table"]
+    ]
+    if settings_rows_unchanged("PTKP Table", rows):
+        frappe.logger().info("PTKP Table DocType already matches defaults, skipping import")
+        return
+
     # Optional: Clear existing records
     frappe.db.sql("DELETE FROM `tabPTKP Table`")
 
-    settings = get_or_create_settings()
-
-    for entry in ptkp_data[0]["ptkp_table"]:
-        doc = frappe.get_doc({
-            "doctype": "PTKP Table",
-            "parent": settings.name,
-            "parenttype": "Payroll Indonesia Settings",
-            "parentfield": "ptkp_table",
-            "tax_status": entry["tax_status"],
-            "ptkp_amount": entry["ptkp_amount"],
-        })
-        doc.insert(ignore_permissions=True)
+    if not settings_checked:
+        get_or_create_settings(load=False)
+    bulk_insert_settings_rows("PTKP Table", "ptkp_table", rows)
     frappe.logger().info("Imported default PTKP Table DocType")
 
-def import_ter_mapping_to_doctype() -> None:
+def import_ter_mapping_to_doctype(settings_checked: bool = False) -> None:
     """
     Import default TER mapping into TER Mapping Table DocType.
     """
@@ -55,23 +212,22 @@ def import_ter_mapping_to_doctype() -> None:
         frappe.logger().warning("TER mapping data not found or invalid format")
         return
 
+    rows = [
+        {"tax_status": entry["tax_status"], "ter_code": entry["ter_code"]}
+        for entry in ter_mapping_data
+    ]
+    if settings_rows_unchanged("TER Mapping Table", rows):
+        frappe.logger().info("TER Mapping Table DocType already matches defaults, skipping import")
+        return
+
     frappe.db.sql("DELETE FROM `tabTER Mapping Table`")
 
-    settings = get_or_create_settings()
-
-    for entry in ter_mapping_data:
-        doc = frappe.get_doc({
-            "doctype": "TER Mapping Table",
-            "parent": settings.name,
-            "parenttype": "Payroll Indonesia Settings",
-            "parentfield": "ter_mapping_table",
-            "tax_status": entry["tax_status"],
-            "ter_code": entry["ter_code"],
-        })
-        doc.insert(ignore_permissions=True)
+    if not settings_checked:
+        get_or_create_settings(load=False)
+    bulk_insert_settings_rows("TER Mapping Table", "ter_mapping_table", rows)
     frappe.logger().info("Imported default TER Mapping Table DocType")
 
-def import_ter_brackets_to_doctype() -> None:
+def import_ter_brackets_to_doctype(settings_checked: bool = False) -> None:
     """
     Import default TER brackets into TER Bracket Table DocType.
     """
@@ -80,140 +236,87 @@ def import_ter_brackets_to_doctype() -> None:
         frappe.logger().warning("TER rate data not found or invalid format")
         return
 
-    frappe.db.sql("DELETE FROM `tabTER Bracket Table`")
-
-    settings = get_or_create_settings()
-
-    for ter_code_data in ter_rate_data:
-        ter_code = ter_code_data["ter_code"]
-        for bracket in ter_code_data["brackets"]:
-            doc = frappe.get_doc({
-                "doctype": "TER Bracket Table",
-                "parent": settings.name,
-                "parenttype": "Payroll Indonesia Settings",
-                "parentfield": "ter_bracket_table",
-                "ter_code": ter_code,
-                "min_income": bracket["min_income"],
-                "max_income": bracket["max_income"] if bracket["max_income"] is not None else 0,
-                "rate_percent": bracket["rate_percent"],
-            })
-            doc.insert(ignore_permissions=True)
+    brackets = normalize_ter_brackets(ter_rate_data)
+    if not brackets:
+        frappe.logger().info("No TER brackets to import")
+        return
+
+    if not settings_checked:
+        get_or_create_settings(load=False)
+    # Deterministic names let the import update rows in place instead of
+    # truncating and re-inserting the whole table on every migrate.
+    upsert_settings_rows(
+        "TER Bracket Table",
+        "ter_bracket_table",
+        brackets,
+        names=[f"TER-{b['ter_code']}-{int(b['min_income'])}" for b in brackets],
+        update_fields=("max_income", "rate_percent"),
+    )
     frappe.logger().info("Imported default TER Bracket Table DocType")
 
 def import_ptkp_table_to_settings() -> None:
-    """(Optional) Import PTKP values into Payroll Indonesia Settings for display/reference."""
-    ptkp_data = load_json("default_ptkp_table.json")
-    if not ptkp_data or not ptkp_data[0].get("ptkp_table"):
-        frappe.logger().warning("PTKP data not found or invalid format")
-        return
-    settings = get_or_create_settings()
-    if not settings:
-        return
-    settings.ptkp_table = []
-    for entry in ptkp_data[0]["ptkp_table"]:
-        settings.append(
-            "ptkp_table", {"tax_status": entry["tax_status"], "ptkp_amount": entry["ptkp_amount"]}
-        )
-    settings.save()
-    frappe.logger().info("Imported default PTKP table to Settings")
+    """(Optional) Import PTKP values into Payroll Indonesia Settings for display/reference.
+    The settings child table is the PTKP Table DocType, so this shares the bulk import."""
+    import_ptkp_table_to_doctype()
 
 def import_ter_mapping_to_settings() -> None:
-    """(Optional) Import TER mapping into Payroll Indonesia Settings for display/reference."""
-    ter_mapping_data = load_json("default_ter_mapping.json")
-    if not ter_mapping_data:
-        frappe.logger().warning("TER mapping data not found or invalid format")
-        return
-    settings = get_or_create_settings()
-    if not settings:
-        return
-    settings.ter_mapping_table = []
-    for entry in ter_mapping_data:
-        settings.append(
-            "ter_mapping_table", {"tax_status": entry["tax_status"], "ter_code": entry["ter_code"]}
-        )
-    settings.save()
-    frappe.logger().info("Imported default TER mapping to Settings")
+    """(Optional) Import TER mapping into Payroll Indonesia Settings for display/reference.
+    The settings child table is the TER Mapping Table DocType, so this shares the bulk import."""
+    import_ter_mapping_to_doctype()
 
 def import_ter_brackets_to_settings() -> None:
-    """(Optional) Import TER brackets into Payroll Indonesia Settings for display/reference."""
-    ter_rate_data = load_json("default_ter_rate.json")
-    if not ter_rate_data:
-        frappe.logger().warning("TER rate data not found or invalid format")
-        return
-    settings = get_or_create_settings()
-    if not settings:
-        return
-    settings.ter_bracket_table = []
-    for ter_code_data in ter_rate_data:
-        ter_code = ter_code_data["ter_code"]
-        for bracket in ter_code_data["brackets"]:
-            settings.append(
-                "ter_bracket_table",
-                {
-                    "ter_code": ter_code,
-                    "min_income": bracket["min_income"],
-                    "max_income": bracket["max_income"] if bracket["max_income"] is not None else 0,
-                    "rate_percent": bracket["rate_percent"],
-                },
-            )
-    settings.save()
-    frappe.logger().info("Imported default TER brackets to Settings")
-
-def get_or_create_settings() -> Optional[Document]:
-    """Get or create Payroll Indonesia Settings document"""
+    """(Optional) Import TER brackets into Payroll Indonesia Settings for display/reference.
+    The settings child table is the TER Bracket Table DocType, so this shares the bulk import."""
+    import_ter_brackets_to_doctype()
+
+def get_or_create_settings(load: bool = True) -> Optional[Document]:
+    """Get or create Payroll Indonesia Settings document.
+    With load=False an existing document is only checked, not loaded."""
     if not frappe.db.exists("Payroll Indonesia Settings", "Payroll Indonesia Settings"):
         settings = frappe.new_doc("Payroll Indonesia Settings")
         settings.name = "Payroll Indonesia Settings"
-        settings.pph21_method = "TER"
-        settings.validate_tax_status_strict = 1
-        settings.salary_slip_use_component_cache = 1
-        settings.auto_queue_salary_slip = 0
-        settings.bpjs_health_employer_rate = 4.0
-        settings.bpjs_health_employer_cap = 12000000
-        settings.bpjs_health_employee_rate = 1.0
-        settings.bpjs_health_employee_cap = 12000000
-        settings.bpjs_jht_employer_rate = 3.7
-        settings.bpjs_jht_employer_cap = 9077600
-        settings.bpjs_jht_employee_rate = 2.0
-        settings.bpjs_jht_employee_cap = 9077600
-        settings.bpjs_jkk_rate = 0.24
-        settings.bpjs_jkk_cap = 9077600
-        settings.bpjs_jkm_rate = 0.3
-        settings.bpjs_jkm_cap = 9077600
-        settings.bpjs_pension_employer_rate = 2.0
-        settings.bpjs_pension_employer_cap = 9077600
-        settings.bpjs_pension_employee_rate = 1.0
-        settings.bpjs_pension_employee_cap = 9077600
-        settings.biaya_jabatan_rate = 5.0
-        settings.biaya_jabatan_cap = 6000000
-        settings.fallback_income_tax_slab = None
+        for fieldname, value in DEFAULT_SETTINGS_VALUES:
+            setattr(settings, fieldname, value)
         settings.insert()
         frappe.logger().info("Created new Payroll Indonesia Settings")
         return settings
-    else:
+    elif load:
         return frappe.get_doc("Payroll Indonesia Settings", "Payroll Indonesia Settings")
+    return None
 
-def setup_default_settings() -> None:
+def fixtures_up_to_date() -> bool:
+    """Return True if the bundled master data of this version is already imported."""
+    try:
+        return frappe.db.get_single_value(SETTINGS_DOCTYPE, "app_fixtures_version") == FIXTURES_VERSION
+    except Exception:
+        return False
+
+def setup_default_settings(autocommit: bool = True) -> None:
     """
     Setup default Payroll Indonesia settings AND migrate master data to DocType Tables.
     This function is called from setup_module.py after_sync.
+    With autocommit=False the caller owns the transaction.
     """
     try:
-        # Migrate master tables to DocType
-        import_ptkp_table_to_doctype()
-        import_ter_mapping_to_doctype()
-        import_ter_brackets_to_doctype()
+        # Make sure the parent Settings exists once for all three tables
+        get_or_create_settings(load=False)
 
-        # (optional) Also import to Settings for display/reference
-        import_ptkp_table_to_settings()
-        import_ter_mapping_to_settings()
-        import_ter_brackets_to_settings()
+        # Migrate master tables to DocType
+        import_ptkp_table_to_doctype(settings_checked=True)
+        import_ter_mapping_to_doctype(settings_checked=True)
+        import_ter_brackets_to_doctype(settings_checked=True)
+        frappe.db.set_single_value(SETTINGS_DOCTYPE, "app_fixtures_version", FIXTURES_VERSION)
+        # Rows were written directly, so Settings.on_update did not run
+        clear_ptkp_cache()
+        clear_ter_rate_cache()
 
-        frappe.db.commit()
+        if autocommit:
+            frappe.db.commit()
         frappe.logger().info("Completed Payroll Indonesia settings and data migration")
     except Exception as e:
-        frappe.db.rollback()
-        frappe.logger().error(f"Error in Payroll Indonesia settings/data migration: {str(e)}")
+        if autocommit:
+            frappe.db.rollback()
+        frappe.logger().error("Error in Payroll Indonesia settings/data migration: %s", e)
         raise
 
 @frappe.whitelist()
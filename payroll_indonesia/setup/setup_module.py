@@ -1,12 +1,16 @@
 """Setup utilities for Payroll Indonesia."""
 
 import json
+import logging
 import os
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
 import frappe
 
-from .gl_account_mapper import assign_gl_accounts_to_salary_components_all
-from .settings_migration import setup_default_settings
+from .gl_account_mapper import assign_gl_accounts_to_salary_components_all, get_companies
+from .settings_migration import fixtures_up_to_date, setup_default_settings
 
 __all__ = ["after_sync"]
 
@@ -15,15 +19,16 @@ def ensure_parent(name: str, company: str, root_type: str, report_type: str) ->
     Ensure parent account exists or update its metadata.
     'name' MUST be in the format "Nama Parent - {company_abbr}".
     """
-    if frappe.db.exists("Account", name):
-        doc = frappe.get_doc("Account", name)
+    # Only two columns are compared, so read them instead of loading the Account
+    existing = frappe.db.get_value("Account", name, ["root_type", "report_type"], as_dict=True)
+    if existing:
         updates: dict[str, str] = {}
-        if doc.root_type != root_type:
+        if existing.root_type != root_type:
             updates["root_type"] = root_type
-        if doc.report_type != report_type:
+        if existing.report_type != report_type:
             updates["report_type"] = report_type
         if updates:
-            frappe.logger().warning(f"Updating parent account {name} for {company} with {updates}")
+            frappe.logger().warning("Updating parent account %s for %s with %s", name, company, updates)
             frappe.db.set_value("Account", name, updates, update_modified=False)
         return True
 
@@ -40,11 +45,11 @@ def ensure_parent(name: str, company: str, root_type: str, report_type: str) ->
             }
         )
         doc.insert(ignore_if_duplicate=True, ignore_permissions=True)
-        frappe.logger().info(f"Created parent account {doc.name} for {company}")
+        frappe.logger().info("Created parent account %s for %s", doc.name, company)
         return True
     except Exception:
         frappe.logger().error(
-            f"Failed creating parent account {name} for {company}\n{traceback.format_exc()}"
+            "Failed creating parent account %s for %s\n%s", name, company, traceback.format_exc()
         )
         return False
 
@@ -52,13 +57,15 @@ def create_accounts_from_json() -> None:
     """Create GL accounts for each company from JSON template."""
     path = frappe.get_app_path("payroll_indonesia", "setup", "default_gl_accounts.json")
     if not os.path.exists(path):
-        frappe.logger().error(f"GL account template not found: {path}")
+        frappe.logger().error("GL account template not found: %s", path)
         return
 
     with open(path) as f:
         template = f.read()
 
-    companies = frappe.get_all("Company", fields=["name", "abbr"])
+    logger = frappe.logger()
+    debug_enabled = logger.isEnabledFor(logging.DEBUG)
+    companies = get_companies()
     for comp in companies:
         company = comp["name"]
         abbr = comp["abbr"]
@@ -68,23 +75,25 @@ def create_accounts_from_json() -> None:
             )
         except Exception:
             frappe.logger().error(
-                f"Failed loading GL accounts for {company}\n{traceback.format_exc()}"
+                "Failed loading GL accounts for %s\n%s", company, traceback.format_exc()
             )
             continue
 
-        frappe.logger().info(f"Processing GL accounts for {company}")
+        frappe.logger().info("Processing GL accounts for %s", company)
+        created = 0
+        # Many accounts share a parent; check each parent once per company
+        parent_status: dict[tuple, bool] = {}
         for acc in accounts:
             parent = acc.get("parent_account")
             if parent:
                 parent_account_full = f"{parent} - {abbr}"
-                if not ensure_parent(
-                    parent_account_full,
-                    company,
-                    acc.get("root_type"),
-                    acc.get("report_type"),
-                ):
+                parent_key = (parent_account_full, acc.get("root_type"), acc.get("report_type"))
+                if parent_key not in parent_status:
+                    parent_status[parent_key] = ensure_parent(parent_account_full, company, *parent_key[1:])
+                if not parent_status[parent_key]:
                     frappe.logger().info(
-                        f"Skipped account {acc.get('account_name')} for {company} because parent {parent_account_full} is missing"
+                        "Skipped account %s for %s because parent %s is missing",
+                        acc.get("account_name"), company, parent_account_full,
                     )
                     continue
                 acc["parent_account"] = parent_account_full
@@ -92,18 +101,21 @@ def create_accounts_from_json() -> None:
             try:
                 doc = frappe.get_doc({"doctype": "Account", **acc})
                 doc.insert(ignore_if_duplicate=True, ignore_permissions=True)
-                frappe.logger().info(f"Created account {doc.name} for {company}")
+                if debug_enabled:
+                    logger.debug("Created account %s for %s", doc.name, company)
+                created += 1
             except Exception:
                 frappe.logger().error(
-                    f"Skipped account {acc.get('account_name')} for {company}\n{traceback.format_exc()}"
+                    "Skipped account %s for %s\n%s",
+                    acc.get("account_name"), company, traceback.format_exc(),
                 )
-        frappe.db.commit()
+        frappe.logger().info("Processed %s of %s GL accounts for %s", created, len(accounts), company)
 
 def create_salary_structures_from_json() -> None:
     """Create Salary Structures from JSON template if missing. Populate formula/fields from Salary Component."""
     path = frappe.get_app_path("payroll_indonesia", "setup", "salary_structure.json")
     if not os.path.exists(path):
-        frappe.logger().error(f"Salary Structure template not found: {path}")
+        frappe.logger().error("Salary Structure template not found: %s", path)
         return
 
     with open(path) as f:
@@ -113,66 +125,92 @@ def create_salary_structures_from_json() -> None:
         structures = json.loads(template)
     except Exception:
         frappe.logger().error(
-            f"Failed loading Salary Structure template\n{traceback.format_exc()}"
+            "Failed loading Salary Structure template\n%s", traceback.format_exc()
         )
         return
 
-    for struct in structures:
-        name = struct.get("name") or struct.get("salary_structure_name")
-        if name and frappe.db.exists("Salary Structure", name):
-            frappe.logger().info(f"Salary Structure '{name}' already exists, skipping.")
+    names = [st.get("name") or st.get("salary_structure_name") for st in structures]
+    existing = set(
+        frappe.get_all(
+            "Salary Structure",
+            filters={"name": ["in", [n for n in names if n]]},
+            pluck="name",
+        )
+    )
+
+    pending = []
+    for struct, name in zip(structures, names):
+        if name and name in existing:
+            frappe.logger().info("Salary Structure '%s' already exists, skipping.", name)
             continue
+        pending.append((struct, name))
 
-        def map_component(detail: dict) -> None:
-            comp_name = detail.get("salary_component")
-            if not comp_name:
-                return
-            try:
-                component = frappe.get_doc("Salary Component", comp_name)
-            except Exception:
-                frappe.logger().warning(
-                    f"Salary Component '{comp_name}' not found while importing"
-                )
-                return
-
-            fields_to_copy = [
-                "formula",
-                "amount_based_on_formula",
-                "depends_on_payment_days",
-                "is_tax_applicable",
-                "statistical_component",
-                "do_not_include_in_total",
-                "round_to_the_nearest_integer",
-                "remove_if_zero_valued",
-                "disabled",
-                "is_income_tax_component",
-                "description",
-            ]
-
-            data = component.as_dict()
-            for field in fields_to_copy:
-                if field in data:
-                    detail[field] = data[field]
-
-            default_fields = {
-                "name",
-                "owner",
-                "creation",
-                "modified",
-                "modified_by",
-                "docstatus",
-                "idx",
-                "doctype",
-                "salary_component",
-                "salary_component_abbr",
-                "type",
-                "company",
-            }
+    # Read all referenced components as plain rows in one query instead of
+    # building a Salary Component document per earning/deduction row
+    component_names = {
+        detail.get("salary_component")
+        for struct, _ in pending
+        for detail in (*struct.get("earnings", []), *struct.get("deductions", []))
+        if detail.get("salary_component")
+    }
+    components = {
+        row.name: row
+        for row in frappe.get_all(
+            "Salary Component",
+            filters={"name": ["in", list(component_names)]},
+            fields=["*"],
+        )
+    } if component_names else {}
 
-            for key, value in data.items():
-                if key not in fields_to_copy and key not in default_fields and value is not None:
-                    detail.setdefault(key, value)
+    fields_to_copy = [
+        "formula",
+        "amount_based_on_formula",
+        "depends_on_payment_days",
+        "is_tax_applicable",
+        "statistical_component",
+        "do_not_include_in_total",
+        "round_to_the_nearest_integer",
+        "remove_if_zero_valued",
+        "disabled",
+        "is_income_tax_component",
+        "description",
+    ]
+
+    default_fields = {
+        "name",
+        "owner",
+        "creation",
+        "modified",
+        "modified_by",
+        "docstatus",
+        "idx",
+        "doctype",
+        "salary_component",
+        "salary_component_abbr",
+        "type",
+        "company",
+    }
+
+    def map_component(detail: dict) -> None:
+        comp_name = detail.get("salary_component")
+        if not comp_name:
+            return
+        data = components.get(comp_name)
+        if data is None:
+            frappe.logger().warning(
+                "Salary Component '%s' not found while importing", comp_name
+            )
+            return
 
+        for field in fields_to_copy:
+            if field in data:
+                detail[field] = data[field]
+
+        for key, value in data.items():
+            if key not in fields_to_copy and key not in default_fields and value is not None:
+                detail.setdefault(key, value)
+
+    for struct, name in pending:
         for earning in struct.get("earnings", []):
             map_component(earning)
         for deduction in struct.get("deductions", []):
@@ -181,46 +219,87 @@ def create_salary_structures_from_json() -> None:
         try:
             doc = frappe.get_doc({"doctype": "Salary Structure", **struct})
             doc.insert(ignore_if_duplicate=True, ignore_permissions=True)
-            frappe.logger().info(f"Created Salary Structure: {doc.name}")
+            frappe.logger().info("Created Salary Structure: %s", doc.name)
         except Exception:
-            frappe.logger().error(f"Skipped Salary Structure {name}\n{traceback.format_exc()}")
+            frappe.logger().error("Skipped Salary Structure %s\n%s", name, traceback.format_exc())
 
-def after_sync() -> None:
-    """Entry point executed on migrate and sync."""
-    frappe.logger().info("🚀 Payroll GL Setup started")
+@contextmanager
+def _install_tx():
+    """Run setup phases in one transaction with a single commit at the end."""
     try:
-        create_accounts_from_json()
+        yield
         frappe.db.commit()
     except Exception:
-        frappe.logger().error(f"Error creating GL accounts\n{traceback.format_exc()}")
         frappe.db.rollback()
         raise
 
-    try:
-        assign_gl_accounts_to_salary_components_all()
-        frappe.db.commit()
-    except Exception:
-        frappe.logger().error(
-            f"Error assigning GL accounts to salary components\n{traceback.format_exc()}"
-        )
-        frappe.db.rollback()
-        raise
 
+def _run_phase(error_message: str, fn, **kwargs) -> None:
+    """Run one setup phase, logging the traceback before re-raising."""
     try:
-        create_salary_structures_from_json()
-        frappe.db.commit()
+        fn(**kwargs)
     except Exception:
-        frappe.logger().error(f"Error creating Salary Structures\n{traceback.format_exc()}")
-        frappe.db.rollback()
+        frappe.logger().error("%s\n%s", error_message, traceback.format_exc())
         raise
 
+
+def _setup_settings(autocommit: bool = True) -> None:
+    """Seed Payroll Indonesia Settings and its master tables unless already current."""
+    if fixtures_up_to_date():
+        frappe.logger().info("Payroll Indonesia master data is up to date, skipping import")
+        return
+    _run_phase(
+        "Error setting up default Payroll Indonesia settings",
+        setup_default_settings,  # Includes DocType master data migration
+        autocommit=autocommit,
+    )
+
+
+def _run_in_site_thread(site: str, sites_path: str, fn) -> None:
+    """Run ``fn`` in a worker thread with its own site connection."""
+    frappe.init(site=site, sites_path=sites_path)
+    frappe.connect()
     try:
-        setup_default_settings()  # Includes DocType master data migration
-        frappe.db.commit()
-        frappe.logger().info("✅ Payroll GL Setup completed")
-    except Exception:
-        frappe.logger().error(
-            f"Error setting up default Payroll Indonesia settings\n{traceback.format_exc()}"
+        fn()
+    finally:
+        frappe.destroy()
+
+
+def after_sync() -> None:
+    """Entry point executed on migrate and sync.
+
+    Accounts, GL mapping and Salary Structures depend on each other and always
+    run in order. Settings seeding touches unrelated tables, so when
+    ``allow_parallel_install`` is set in site config it runs in a worker
+    thread on a separate connection while the account chain proceeds.
+    All phases on the main connection share one transaction.
+    """
+    frappe.logger().info("🚀 Payroll GL Setup started")
+
+    executor = None
+    settings_future = None
+    if frappe.conf.get("allow_parallel_install"):
+        executor = ThreadPoolExecutor(max_workers=1)
+        settings_future = executor.submit(
+            _run_in_site_thread, frappe.local.site, frappe.local.sites_path, _setup_settings
         )
-        frappe.db.rollback()
-        raise
\ No newline at end of file
+
+    try:
+        with _install_tx():
+            _run_phase("Error creating GL accounts", create_accounts_from_json)
+            _run_phase(
+                "Error assigning GL accounts to salary components",
+                assign_gl_accounts_to_salary_components_all,
+                autocommit=False,
+            )
+            _run_phase("Error creating Salary Structures", create_salary_structures_from_json)
+            if settings_future is None:
+                _setup_settings(autocommit=False)
+    finally:
+        if executor:
+            executor.shutdown(wait=True)
+
+    if settings_future:
+        settings_future.result()
+
+    frappe.logger().info("✅ Payroll GL Setup completed")
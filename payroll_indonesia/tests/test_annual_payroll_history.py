@@ -10,11 +10,11 @@ def test_get_or_create_creates(monkeypatch):
         get_or_create_annual_payroll_history,
     )
 
-    employee = types.SimpleNamespace(company="Test Co", employee_name="John Doe")
+    employee = {"company": "Test Co", "employee_name": "John Doe"}
     monkeypatch.setattr(
-        frappe,
-        "get_doc",
-        lambda dt, name: employee if dt == "Employee" else {},
+        frappe.db,
+        "get_value",
+        lambda dt, *a, **k: employee if dt == "Employee" else None,
     )
 
     doc = get_or_create_annual_payroll_history(employee_id="EMP001", fiscal_year="2024")
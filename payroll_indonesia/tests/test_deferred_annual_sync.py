@@ -0,0 +1,204 @@
+import sys
+import types
+import importlib
+
+import frappe
+
+if not hasattr(frappe.utils, "file_lock"):
+    frappe.utils.file_lock = lambda *a, **k: None
+
+import payroll_indonesia.override.payroll_entry as payroll_entry_mod
+
+
+def test_deferred_sync_flushes_once_per_employee(monkeypatch):
+    # Stub frappe environment
+    frappe = types.SimpleNamespace()
+
+    class DummyLogger:
+        def debug(self, *a, **k):
+            pass
+
+        def info(self, *a, **k):
+            pass
+
+        def warning(self, *a, **k):
+            pass
+
+    frappe.logger = lambda *a, **k: DummyLogger()
+    frappe.throw = lambda *a, **k: None
+    frappe.log_error = lambda *a, **k: None
+    frappe.flags = {}
+    frappe.db = types.SimpleNamespace(get_value=lambda *a, **k: None)
+    frappe.utils = types.SimpleNamespace(now=lambda: "now")
+
+    sys.modules["frappe"] = frappe
+    sys.modules["frappe.utils"] = frappe.utils
+
+    if "payroll_indonesia.utils.sync_annual_payroll_history" in sys.modules:
+        del sys.modules["payroll_indonesia.utils.sync_annual_payroll_history"]
+    sync_mod = importlib.import_module(
+        "payroll_indonesia.utils.sync_annual_payroll_history"
+    )
+
+    calls = []
+    monkeypatch.setattr(
+        sync_mod, "sync_annual_payroll_history_for_bulan", lambda **kwargs: calls.append(kwargs)
+    )
+
+    emp1 = {"name": "EMP-1", "company": "Test Co", "employee_name": "One"}
+    emp2 = {"name": "EMP-2", "company": "Test Co", "employee_name": "Two"}
+    summary = {"pph21_annual": 100}
+
+    with sync_mod.deferred_annual_payroll_sync():
+        buffer = sync_mod.get_deferred_sync_buffer()
+        buffer.append((emp1, "2024", {"bulan": 12, "salary_slip": "SS-3"}, summary))
+        buffer.append((emp2, "2024", {"bulan": 5, "salary_slip": "SS-2"}, None))
+        buffer.append((emp1, "2024", {"bulan": 11, "salary_slip": "SS-1"}, None))
+        assert calls == []
+
+    assert sync_mod.get_deferred_sync_buffer() is None
+    assert len(calls) == 2
+    assert calls[0]["employee"] == emp1
+    assert [r["bulan"] for r in calls[0]["monthly_results"]] == [11, 12]
+    assert calls[0]["summary"] == summary
+    assert calls[1]["employee"] == emp2
+    assert calls[1]["summary"] is None
+
+
+def test_deferred_sync_reports_failed_groups(monkeypatch):
+    frappe = types.SimpleNamespace()
+
+    class DummyLogger:
+        def debug(self, *a, **k):
+            pass
+
+        def info(self, *a, **k):
+            pass
+
+        def warning(self, *a, **k):
+            pass
+
+    logged = []
+    frappe.logger = lambda *a, **k: DummyLogger()
+    frappe.throw = lambda *a, **k: None
+    frappe.log_error = lambda *a, **k: logged.append(k)
+    frappe.flags = {}
+    frappe.db = types.SimpleNamespace(get_value=lambda *a, **k: None)
+    frappe.utils = types.SimpleNamespace(now=lambda: "now")
+
+    sys.modules["frappe"] = frappe
+    sys.modules["frappe.utils"] = frappe.utils
+
+    if "payroll_indonesia.utils.sync_annual_payroll_history" in sys.modules:
+        del sys.modules["payroll_indonesia.utils.sync_annual_payroll_history"]
+    sync_mod = importlib.import_module(
+        "payroll_indonesia.utils.sync_annual_payroll_history"
+    )
+
+    calls = []
+
+    def fake_sync(**kwargs):
+        calls.append(kwargs)
+        if kwargs["employee"]["name"] == "EMP-1":
+            raise Exception("history locked")
+
+    monkeypatch.setattr(sync_mod, "sync_annual_payroll_history_for_bulan", fake_sync)
+
+    emp1 = {"name": "EMP-1", "company": "Test Co", "employee_name": "One"}
+    emp2 = {"name": "EMP-2", "company": "Test Co", "employee_name": "Two"}
+
+    failed = []
+    with sync_mod.deferred_annual_payroll_sync(failed):
+        buffer = sync_mod.get_deferred_sync_buffer()
+        buffer.append((emp1, "2024", {"bulan": 12, "salary_slip": "SS-3"}, None))
+        buffer.append((emp2, "2024", {"bulan": 5, "salary_slip": "SS-2"}, None))
+        buffer.append((emp1, "2024", {"bulan": 11, "salary_slip": "SS-1"}, None))
+
+    # The failing group does not stop the other one and is reported back
+    assert len(calls) == 2
+    assert failed == ["SS-1", "SS-3"]
+    assert len(logged) == 1
+    assert "SS-1, SS-3" in logged[0]["message"]
+
+    assert sync_mod.flush_deferred_annual_payroll_sync(
+        [(emp2, "2024", {"bulan": 5, "salary_slip": "SS-2"}, None)]
+    ) == []
+
+
+def test_failed_history_sync_keeps_submitted_slip_processed(monkeypatch):
+    import datetime
+
+    pe = payroll_entry_mod
+    # Module namespace the entry's deferred sync helpers actually run in
+    sync_globals = pe.deferred_annual_payroll_sync.__wrapped__.__globals__
+
+    class DummyLogger:
+        def isEnabledFor(self, *a):
+            return False
+
+        def __getattr__(self, name):
+            return lambda *a, **k: None
+
+    sync_frappe = types.SimpleNamespace(
+        flags={},
+        log_error=lambda *a, **k: None,
+        logger=lambda *a, **k: DummyLogger(),
+    )
+    monkeypatch.setitem(sync_globals, "frappe", sync_frappe)
+
+    def failing_sync(**kwargs):
+        raise Exception("history locked")
+
+    monkeypatch.setitem(sync_globals, "sync_annual_payroll_history_for_bulan", failing_sync)
+
+    pe_frappe = types.SimpleNamespace(
+        get_meta=lambda *a, **k: types.SimpleNamespace(has_field=lambda f: False),
+        get_doc=lambda *a, **k: None,
+        utils=types.SimpleNamespace(getdate=lambda v: datetime.date(2024, 12, 1)),
+    )
+    monkeypatch.setattr(pe, "frappe", pe_frappe)
+    monkeypatch.setattr(pe, "logger", DummyLogger())
+
+    history_calls = []
+    monkeypatch.setattr(
+        pe, "sync_annual_payroll_history", lambda **kwargs: history_calls.append(kwargs)
+    )
+
+    employee = {"name": "EMP-1", "company": "Test Co", "employee_name": "One"}
+
+    class Slip:
+        def __init__(self, name):
+            self.name = name
+            self.employee = "EMP-1"
+            self.docstatus = 0
+            self.earnings = []
+            self.deductions = []
+            self.flags = types.SimpleNamespace()
+
+        def save(self, **kwargs):
+            pass
+
+        def submit(self):
+            # on_submit queues the monthly result while deferral is active
+            self.docstatus = 1
+            sync_globals["get_deferred_sync_buffer"]().append(
+                (employee, "2024", {"bulan": 12, "salary_slip": self.name}, None)
+            )
+
+    entry = pe.CustomPayrollEntry()
+    entry.name = "PE-1"
+    entry.start_date = "2024-12-01"
+    entry.auto_submit_salary_slips = 1
+    entry._employee_cache = {"EMP-1": employee}
+    entry._load_salary_slips = lambda names: {name: Slip(name) for name in names}
+
+    processed, invalid = entry._process_slip_batch(["SS-1", "SS-2"], lambda slip: None)
+
+    # Submitted slips stay processed and linked to the entry
+    assert processed == ["SS-1", "SS-2"]
+    assert invalid == []
+
+    # Only the error state is recorded; the slips are not removed from history
+    assert [call["error_state"]["payroll_entry"] for call in history_calls] == ["PE-1", "PE-1"]
+    assert all(call["cancelled_salary_slip"] is None for call in history_calls)
+    assert all(call["monthly_results"] is None for call in history_calls)
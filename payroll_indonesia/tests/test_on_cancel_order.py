@@ -73,6 +73,18 @@ def test_on_cancel_respects_tax_type_and_dates():
     }
 
     frappe.get_doc = lambda dt, name: slips[name]
+    frappe.get_all = lambda dt, filters=None, fields=None: [
+        types.SimpleNamespace(
+            name=slip.name,
+            docstatus=1,
+            posting_date=slip.posting_date,
+            start_date=slip.start_date,
+            tax_type=slip.tax_type,
+            pph21_info=slip.pph21_info,
+        )
+        for slip in slips.values()
+        if slip.name in filters["name"][1]
+    ]
 
     class Detail:
         def __init__(self, name):
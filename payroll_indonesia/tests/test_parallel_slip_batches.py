@@ -0,0 +1,88 @@
+import threading
+import types
+
+import frappe
+
+if not hasattr(frappe.utils, "file_lock"):
+    frappe.utils.file_lock = lambda *a, **k: None
+
+import payroll_indonesia.override.payroll_entry as pe
+
+
+def test_parallel_batches_isolate_failures(monkeypatch):
+    caller_events = []
+    runs = []
+    current = threading.local()
+
+    def record(event):
+        # Worker events are grouped per batch run; init starts a new run
+        run = getattr(current, "run", None)
+        if run is None:
+            caller_events.append(event)
+        else:
+            run.append(event)
+
+    def init(**kwargs):
+        current.run = ["init"]
+        runs.append(current.run)
+
+    def destroy():
+        record("destroy")
+        current.run = None
+
+    stub = types.SimpleNamespace(
+        local=types.SimpleNamespace(site="test.site", sites_path="sites"),
+        session=types.SimpleNamespace(user="Administrator"),
+        db=types.SimpleNamespace(
+            commit=lambda: record("commit"),
+            rollback=lambda: record("rollback"),
+        ),
+        init=init,
+        connect=lambda: record("connect"),
+        set_user=lambda user: record("set_user"),
+        destroy=destroy,
+    )
+    monkeypatch.setattr(pe, "frappe", stub)
+
+    logged = []
+    monkeypatch.setattr(pe, "_log_errors", lambda errors: logged.extend(errors))
+
+    class DummyLogger:
+        def __getattr__(self, name):
+            return lambda *a, **k: None
+
+    monkeypatch.setattr(pe, "logger", DummyLogger())
+
+    entry = pe.CustomPayrollEntry()
+    entry.name = "PE-1"
+    entry._employee_cache = {"EMP-1": {"name": "EMP-1"}}
+    workers_seen = []
+
+    def process_batch(self, names, tax_calculator):
+        workers_seen.append((self, self._employee_cache))
+        record("batch")
+        if "SS-2" in names:
+            raise Exception("connection lost")
+        # Slips of a batch come back out of order and partly invalid
+        return [n for n in reversed(names) if n != "SS-5"], [n for n in names if n == "SS-5"]
+
+    monkeypatch.setattr(pe.CustomPayrollEntry, "_process_slip_batch", process_batch)
+
+    slips = ["SS-1", "SS-2", "SS-3", "SS-4", "SS-5", "SS-6"]
+    processed, invalid = entry._process_slip_batches_parallel(slips, lambda slip: None, 2)
+
+    # Batches are slips[0::2] and slips[1::2]; the second one fails as a whole
+    assert processed == ["SS-1", "SS-3"]
+    assert invalid == ["SS-2", "SS-4", "SS-5", "SS-6"]
+    assert len(logged) == 1 and "connection lost" in logged[0][1]
+
+    # The caller's transaction is committed once, before any worker starts
+    assert caller_events == ["commit"]
+    ok = ["init", "connect", "set_user", "batch", "commit", "destroy"]
+    failed = ["init", "connect", "set_user", "batch", "rollback", "destroy"]
+    assert sorted(runs) == sorted([ok, failed])
+
+    # Workers run on their own copy of the entry and of the employee cache
+    for worker, cache in workers_seen:
+        assert worker is not entry
+        assert cache == entry._employee_cache and cache is not entry._employee_cache
@@ -0,0 +1,129 @@
+import ast
+import types
+import unicodedata
+
+import pytest
+import frappe
+
+if not hasattr(frappe.utils, "file_lock"):
+    frappe.utils.file_lock = lambda *a, **k: None
+
+import payroll_indonesia.override.salary_slip as ss
+
+SAFE_GLOBALS = {"int": int, "float": float, "round": round}
+
+
+def _validate_safe_eval_syntax(code):
+    # Same node check as frappe.utils.safe_exec._validate_safe_eval_syntax
+    for node in ast.walk(ast.parse(code, mode="eval")):
+        if isinstance(node, ast.NamedExpr):
+            raise SyntaxError("Operation not allowed")
+
+
+def _frappe_safe_eval(code, eval_globals=None, eval_locals=None):
+    # Reference of frappe.safe_eval: normalize, validate, eval without builtins
+    code = unicodedata.normalize("NFKC", code)
+    if "__" in code:
+        raise SyntaxError('Cannot use "__"')
+    _validate_safe_eval_syntax(code)
+    eval_globals = dict(eval_globals or {})
+    eval_globals["__builtins__"] = {}
+    eval_globals.update(SAFE_GLOBALS)
+    return eval(code, eval_globals, eval_locals)
+
+
+def _baseline_eval(code, data, hook_globals, extra=None):
+    # Baseline eval_condition_and_formula: merged context passed as safe_eval globals
+    context = data.copy()
+    context.update(hook_globals)
+    context.update(extra or {})
+    return _frappe_safe_eval(code, context)
+
+
+@pytest.fixture
+def compiled_path(monkeypatch):
+    """Run _eval_formula on the compile-once path with framework-like validation."""
+    monkeypatch.setattr(ss, "_validate_safe_eval_syntax", _validate_safe_eval_syntax)
+    monkeypatch.setattr(ss, "_FORMULA_GLOBALS", {"__builtins__": {}, **SAFE_GLOBALS})
+    monkeypatch.setattr(ss, "get_salary_slip_globals", lambda: {})
+    ss._compile_formula.cache_clear()
+    yield
+    ss._compile_formula.cache_clear()
+
+
+@pytest.mark.parametrize(
+    "expr",
+    [
+        "().__class__.__bases__[0].__subclasses__()",
+        "base.__class__",
+        "(x := 1)",
+        "getattr(base, 'real')",
+    ],
+)
+def test_unsafe_formula_is_rejected(compiled_path, expr):
+    with pytest.raises(Exception):
+        ss._eval_formula(expr, {"base": 100})
+
+
+@pytest.mark.parametrize(
+    "expr",
+    [
+        "base > 5000000 and status == 'TK0'",
+        "round(base * 0.02) if base < 12000000 else int(12000000 * 0.02)",
+        "min(base, 9559600) * 0.01",
+    ],
+)
+def test_formula_matches_safe_eval(compiled_path, expr):
+    data = {"base": 7500000.0, "status": "TK0", "min": min}
+    assert ss._eval_formula(expr, dict(data)) == _frappe_safe_eval(expr, data)
+    # Second call is served from the compiled cache
+    assert ss._eval_formula(expr, dict(data)) == _frappe_safe_eval(expr, data)
+
+
+@pytest.mark.parametrize(
+    "expr",
+    [
+        "sum(x * base for x in (1, 2))",
+        "[round(base * r) for r in (0.01, 0.02)][1]",
+        "max(v for v in (base, gross_pay) if v > 0)",
+    ],
+)
+def test_comprehension_sees_slip_variables(compiled_path, expr):
+    data = {"base": 7500000.0, "gross_pay": 8000000.0, "max": max, "sum": sum}
+    row = types.SimpleNamespace(condition=None, formula=expr, salary_component="Basic", abbr="B")
+
+    slip = ss.CustomSalarySlip()
+    assert slip.eval_condition_and_formula(row, dict(data)) == _baseline_eval(expr, data, {})
+
+
+def test_bad_formula_raises_after_precompile_skip(compiled_path, monkeypatch):
+    row = types.SimpleNamespace(
+        condition=None, formula="base * (", salary_component="Basic", abbr="B", amount=0
+    )
+
+    # Precompile skips the invalid expression instead of failing structure save
+    ss.precompile_structure_formulas([row])
+
+    def throw(msg, *a, **k):
+        raise ss.frappe.ValidationError(msg)
+
+    monkeypatch.setattr(ss.frappe, "throw", throw)
+
+    slip = ss.CustomSalarySlip()
+    with pytest.raises(ss.frappe.ValidationError, match="Basic"):
+        slip.eval_condition_and_formula(row, {"base": 100})
+
+
+def test_comprehension_sees_hook_globals(compiled_path, monkeypatch):
+    hook_globals = {"get_bpjs_cap": lambda kind: {"jp": 10042300.0}[kind], "rate": 0.01}
+    monkeypatch.setattr(ss, "get_salary_slip_globals", lambda: hook_globals)
+
+    expr = "sum(min(v, get_bpjs_cap('jp')) * rate for v in (base, gross_pay))"
+    # A hook global overrides a slip variable of the same name, as before
+    data = {"base": 7500000.0, "gross_pay": 12000000.0, "rate": 0.5, "min": min, "sum": sum}
+    row = types.SimpleNamespace(condition="base > 0", formula=expr, salary_component="JP", abbr="JP")
+
+    slip = ss.CustomSalarySlip()
+    assert slip.eval_condition_and_formula(row, dict(data)) == _baseline_eval(expr, data, hook_globals)
+    # The per-site globals dict is shared across slips and must stay untouched
+    assert set(hook_globals) == {"get_bpjs_cap", "rate"}
@@ -2,6 +2,8 @@ import frappe
 import re
 import json
 import traceback
+from contextlib import contextmanager
+from datetime import datetime
 from typing import Dict, List, Optional, Tuple, Union, Any
 
 try:
@@ -22,6 +24,79 @@ except Exception:  # pragma: no cover - fallback for test stubs without cint/flt
             return 0.0
 
 
+# Map of summary field keys to DocType field names for any fields that don't match exactly
+SUMMARY_FIELD_MAPPING = {
+    "pengurang_netto_total": "pengurang_netto_total",
+    "biaya_jabatan_total": "biaya_jabatan_total",
+    # Add more mappings as needed
+}
+
+# Numeric columns of Annual Payroll History Child copied from monthly results
+MONTHLY_NUMERIC_FIELDS = (
+    "bruto",
+    "pengurang_netto",
+    "biaya_jabatan",
+    "netto",
+    "pkp",
+    "rate",
+    "pph21",
+)
+
+# Numeric summary columns of Annual Payroll History initialized on new documents
+SUMMARY_NUMERIC_FIELDS = (
+    "bruto_total",
+    "netto_total",
+    "pengurang_netto_total",
+    "biaya_jabatan_total",
+    "ptkp_annual",
+    "pkp_annual",
+    "pph21_annual",
+    "koreksi_pph21",
+)
+
+# frappe.flags key memoizing DocType field defaults for the current request
+FIELD_DEFAULTS_FLAG = "payroll_indonesia_field_defaults"
+
+
+def get_field_defaults(doctype: str, fieldnames: Tuple[str, ...]) -> Dict[str, Any]:
+    """
+    Return DocType defaults of the given fields, memoized per request.
+    
+    A payroll run syncs many slips in one request, so the meta lookup is
+    done once per DocType instead of once per history row.
+    
+    Args:
+        doctype: DocType name
+        fieldnames: Fields to read defaults for
+        
+    Returns:
+        Dict of fieldname to default for fields that define one; empty if
+        the meta cannot be loaded
+    """
+    flags = getattr(frappe, "flags", None)
+    memo = flags.get(FIELD_DEFAULTS_FLAG) if flags is not None else None
+    key = (doctype, fieldnames)
+    if memo is not None and key in memo:
+        return memo[key]
+
+    defaults: Dict[str, Any] = {}
+    try:
+        doctype_meta = frappe.get_meta(doctype)
+        for field in fieldnames:
+            field_def = doctype_meta.get_field(field)
+            if field_def and field_def.default is not None:
+                defaults[field] = field_def.default
+    except Exception:
+        # If we can't get meta, callers fall back to 0
+        defaults = {}
+
+    if flags is not None:
+        if memo is None:
+            memo = flags[FIELD_DEFAULTS_FLAG] = {}
+        memo[key] = defaults
+    return defaults
+
+
 def sanitize_savepoint_name(name: str) -> str:
     """
     Sanitize savepoint name to contain only safe characters and limit its length.
@@ -75,10 +150,18 @@ def truncate_doc_name(name: str, max_length: int = 140) -> str:
         return name[:max_length]
 
 
+def _employee_field(employee: Any, fieldname: str) -> Any:
+    """Read a field from an Employee dict or document."""
+    if isinstance(employee, dict):
+        return employee.get(fieldname)
+    return getattr(employee, fieldname, None)
+
+
 def get_or_create_annual_payroll_history(
     employee_id: str, 
     fiscal_year: str, 
-    create_if_missing: bool = True
+    create_if_missing: bool = True,
+    employee_info: Optional[Dict[str, Any]] = None,
 ) -> Optional[Any]:
     """
     Get or create Annual Payroll History document.
@@ -87,6 +170,8 @@ def get_or_create_annual_payroll_history(
         employee_id: Employee ID
         fiscal_year: Fiscal year
         create_if_missing: Whether to create document if not found
+        employee_info: Already resolved ``company`` and ``employee_name`` of the
+            employee; Employee is only queried when these are missing
         
     Returns:
         Annual Payroll History document or None
@@ -107,13 +192,17 @@ def get_or_create_annual_payroll_history(
     history.employee = employee_id
     history.fiscal_year = fiscal_year
 
-    employee_doc = None
-    try:
-        employee_doc = frappe.get_doc("Employee", employee_id)
-    except Exception:
-        employee_doc = None
+    employee_doc = employee_info or {}
+    if not (employee_doc.get("company") and employee_doc.get("employee_name")):
+        # Only two columns are needed, so skip loading the full Employee document
+        try:
+            employee_doc = frappe.db.get_value(
+                "Employee", employee_id, ["company", "employee_name"], as_dict=True
+            )
+        except Exception:
+            employee_doc = None
 
-    company = getattr(employee_doc, "company", None)
+    company = _employee_field(employee_doc, "company")
     if not company and getattr(frappe, "defaults", None):
         try:
             company = frappe.defaults.get_global_default("company")
@@ -128,7 +217,7 @@ def get_or_create_annual_payroll_history(
             company = None
 
     history.company = company
-    history.employee_name = getattr(employee_doc, "employee_name", None) or employee_id
+    history.employee_name = _employee_field(employee_doc, "employee_name") or employee_id
 
     # Validate and truncate document name
     history.name = truncate_doc_name(f"{employee_id}-{fiscal_year}")
@@ -150,16 +239,9 @@ def update_annual_payroll_summary(history: Any, summary: Dict[str, Any]) -> None
     if not summary:
         return
         
-    # Map of summary field keys to DocType field names for any fields that don't match exactly
-    field_mapping = {
-        "pengurang_netto_total": "pengurang_netto_total",
-        "biaya_jabatan_total": "biaya_jabatan_total",
-        # Add more mappings as needed
-    }
-        
     for k, v in summary.items():
         # Check if there's a mapping for this field
-        field_name = field_mapping.get(k, k)
+        field_name = SUMMARY_FIELD_MAPPING.get(k, k)
         
         # If value is None, don't explicitly set it to 0
         # This allows the DocType's default value to be used
@@ -173,17 +255,42 @@ def update_annual_payroll_summary(history: Any, summary: Dict[str, Any]) -> None
             history.set(field_name, v)
 
 
+def get_salary_slip_docstatus(salary_slip_names: List[str]) -> Dict[str, int]:
+    """
+    Fetch docstatus for several salary slips with a single query.
+    
+    Args:
+        salary_slip_names: Names of the salary slips
+        
+    Returns:
+        Dictionary of docstatus keyed by salary slip name; missing slips are absent
+    """
+    if not salary_slip_names:
+        return {}
+    return {
+        row.name: cint(row.docstatus)
+        for row in frappe.get_all(
+            "Salary Slip",
+            filters={"name": ["in", list(set(salary_slip_names))]},
+            fields=["name", "docstatus"],
+        )
+    }
+
+
 def is_salary_slip_valid(
     salary_slip_name: str, 
-    in_transaction_context: bool = False
+    in_transaction_context: bool = False,
+    docstatus_map: Optional[Dict[str, int]] = None,
 ) -> Tuple[bool, Optional[str]]:
     """
     Check if a salary slip is valid for inclusion in Annual Payroll History.
     
     Args:
         salary_slip_name: Name of the salary slip
-        in_transaction_context: Whether this is called within a transaction context
-                              like a savepoint (affects database access)
+        in_transaction_context: Kept for compatibility; the lookup is the same
+                              inside and outside a savepoint
+        docstatus_map: Docstatus prefetched with get_salary_slip_docstatus; when
+                       given, no query is made for this slip
         
     Returns:
         Tuple of (is_valid, reason_if_invalid)
@@ -204,39 +311,38 @@ def is_salary_slip_valid(
         if re.search(pattern, str(salary_slip_name), re.IGNORECASE):
             return False, f"Salary slip has temporary name pattern: {pattern}"
     
-    # If we're in a transaction context, use frappe.get_doc() instead of direct DB access
-    # This ensures we use the current transaction's view of the database
-    if in_transaction_context:
-        try:
-            slip = frappe.get_doc("Salary Slip", salary_slip_name)
-            if cint(slip.docstatus) != 1:
-                status_map = {0: "Draft", 1: "Submitted", 2: "Cancelled"}
-                return False, f"Salary slip exists but has invalid status: {status_map.get(cint(slip.docstatus), 'Unknown')}"
-            return True, None
-        except frappe.DoesNotExistError:
+    if docstatus_map is not None:
+        if salary_slip_name not in docstatus_map:
             return False, f"Salary slip does not exist in database: {salary_slip_name}"
-        except Exception as e:
-            return False, f"Error checking salary slip: {str(e)}"
-    else:
-        # Outside transaction context, direct DB access is fine
-        if not frappe.db.exists("Salary Slip", salary_slip_name):
-            return False, f"Salary slip does not exist in database: {salary_slip_name}"
-        
-        docstatus = frappe.db.get_value("Salary Slip", salary_slip_name, "docstatus")
-        if cint(docstatus) != 1:
+        docstatus = docstatus_map[salary_slip_name]
+        if docstatus != 1:
             status_map = {0: "Draft", 1: "Submitted", 2: "Cancelled"}
-            return False, f"Salary slip exists but has invalid status: {status_map.get(cint(docstatus), 'Unknown')}"
-        
+            return False, f"Salary slip exists but has invalid status: {status_map.get(docstatus, 'Unknown')}"
         return True, None
 
+    # A single lookup doubles as the existence check. It runs on the same
+    # connection, so inside a savepoint it sees the current transaction too.
+    docstatus = frappe.db.get_value("Salary Slip", salary_slip_name, "docstatus")
+    if docstatus is None:
+        return False, f"Salary slip does not exist in database: {salary_slip_name}"
+    if cint(docstatus) != 1:
+        status_map = {0: "Draft", 1: "Submitted", 2: "Cancelled"}
+        return False, f"Salary slip exists but has invalid status: {status_map.get(cint(docstatus), 'Unknown')}"
+    
+    return True, None
 
-def upsert_monthly_detail(history: Any, month_data: Dict[str, Any]) -> bool:
+
+def upsert_monthly_detail(
+    history: Any, month_data: Dict[str, Any], validate_slip: bool = True
+) -> bool:
     """
     Update or insert monthly detail in Annual Payroll History.
     
     Args:
         history: Annual Payroll History document
         month_data: Monthly data to insert or update
+        validate_slip: Check the salary slip first; callers that already
+                       validated it pass False
         
     Returns:
         True if detail was updated, False otherwise
@@ -259,7 +365,7 @@ def upsert_monthly_detail(history: Any, month_data: Dict[str, Any]) -> bool:
     except (ValueError, TypeError):
         bulan = 1  # Default to January if invalid
 
-    if salary_slip:
+    if salary_slip and validate_slip:
         # Pass in_transaction_context=True since this is typically called within a savepoint
         is_valid, reason = is_salary_slip_valid(salary_slip, in_transaction_context=True)
         if not is_valid:
@@ -282,16 +388,6 @@ def upsert_monthly_detail(history: Any, month_data: Dict[str, Any]) -> bool:
             found = detail
             break
 
-    numeric_fields = [
-        "bruto",
-        "pengurang_netto",
-        "biaya_jabatan",
-        "netto",
-        "pkp",
-        "rate",
-        "pph21",
-    ]
-
     if found:
         target = found
     else:
@@ -314,31 +410,21 @@ def upsert_monthly_detail(history: Any, month_data: Dict[str, Any]) -> bool:
             except Exception:
                 target.set("error_state", json.dumps(error_state))
     
-    # Get DocType metadata to check field defaults
-    doctype_meta = None
-    try:
-        doctype_meta = frappe.get_meta("Annual Payroll History Child")
-    except Exception:
-        # If we can't get meta, we'll just use values as is
-        pass
+    # DocType defaults of the numeric columns, loaded once per request
+    field_defaults = None
     
-    for field in numeric_fields:
+    for field in MONTHLY_NUMERIC_FIELDS:
         if field in month_data:
             value = month_data.get(field)
             
             # Only process fields that are present in month_data
-            # If value is None, check if we should use the DocType default
-            if value is None and doctype_meta:
-                # Try to get the default from DocType definition
-                field_def = doctype_meta.get_field(field)
-                if field_def and field_def.default is not None:
-                    value = field_def.default
-                else:
-                    # If no default in DocType, use 0 as last resort
-                    value = 0
-            elif value is None:
-                # If we couldn't get meta, default to 0 for None values
-                value = 0
+            # If value is None, use the DocType default, or 0 as last resort
+            if value is None:
+                if field_defaults is None:
+                    field_defaults = get_field_defaults(
+                        "Annual Payroll History Child", MONTHLY_NUMERIC_FIELDS
+                    )
+                value = field_defaults.get(field, 0)
                 
             target.set(field, flt(value))
 
@@ -442,16 +528,17 @@ def sync_annual_payroll_history(
     # Get additional employee data if needed
     if not employee_info.get("company") or not employee_info.get("employee_name"):
         try:
-            if hasattr(frappe, "db") and hasattr(frappe.db, "get_value"):
-                extra = frappe.db.get_value(
-                    "Employee",
-                    employee_id,
-                    ["name", "company", "employee_name"],
-                    as_dict=True,
+            extra = frappe.get_cached_value(
+                "Employee",
+                employee_id,
+                ["name", "company", "employee_name"],
+                as_dict=True,
+            )
+            if extra:
+                employee_info["company"] = employee_info.get("company") or extra.get("company")
+                employee_info["employee_name"] = (
+                    employee_info.get("employee_name") or extra.get("employee_name")
                 )
-                if extra:
-                    employee_info.setdefault("company", extra.get("company"))
-                    employee_info.setdefault("employee_name", extra.get("employee_name"))
         except Exception:
             pass
 
@@ -505,6 +592,100 @@ def sync_annual_payroll_history(
     return last_doc
 
 
+# frappe.flags key holding the deferred sync buffer of the current payroll run
+DEFERRED_SYNC_FLAG = "payroll_indonesia_deferred_aph_sync"
+
+
+def get_deferred_sync_buffer() -> Optional[List[Tuple[Dict[str, Any], str, Dict[str, Any], Optional[Dict[str, Any]]]]]:
+    """
+    Return the buffer collecting Annual Payroll History syncs, if deferral is active.
+    
+    Returns:
+        List of (employee_info, fiscal_year, monthly_result, summary) or None
+    """
+    flags = getattr(frappe, "flags", None) or {}
+    return flags.get(DEFERRED_SYNC_FLAG)
+
+
+@contextmanager
+def deferred_annual_payroll_sync(failed_slips: Optional[List[str]] = None):
+    """
+    Buffer Annual Payroll History syncs of slips submitted inside the block.
+    
+    Salary slips submitted while the block is active queue their monthly
+    result instead of writing the history immediately. On exit the buffer is
+    flushed with one sync call per employee and fiscal year.
+    
+    Args:
+        failed_slips: Optional list that receives the salary slips whose
+            history could not be written when the buffer is flushed
+    
+    Yields:
+        The buffer list
+    """
+    buffer: List[Tuple[Dict[str, Any], str, Dict[str, Any], Optional[Dict[str, Any]]]] = []
+    frappe.flags[DEFERRED_SYNC_FLAG] = buffer
+    try:
+        yield buffer
+    finally:
+        frappe.flags[DEFERRED_SYNC_FLAG] = None
+    failed = flush_deferred_annual_payroll_sync(buffer)
+    if failed_slips is not None:
+        failed_slips.extend(failed)
+
+
+def flush_deferred_annual_payroll_sync(
+    buffer: List[Tuple[Dict[str, Any], str, Dict[str, Any], Optional[Dict[str, Any]]]]
+) -> List[str]:
+    """
+    Write buffered monthly results grouped by employee and fiscal year.
+    
+    All months of a group are upserted into the history in a single
+    load/save instead of one save per month. A failing group is logged and
+    does not stop the remaining groups.
+    
+    Args:
+        buffer: List of (employee_info, fiscal_year, monthly_result, summary)
+    
+    Returns:
+        Salary slip names of the groups whose history could not be written
+    """
+    groups: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for employee_info, fiscal_year, monthly_result, summary in buffer:
+        group = groups.setdefault(
+            (employee_info["name"], fiscal_year),
+            {"employee": employee_info, "monthly_results": [], "summary": None},
+        )
+        group["monthly_results"].append(monthly_result)
+        if summary:
+            group["summary"] = summary
+
+    failed_slips: List[str] = []
+    for (employee_id, fiscal_year), group in groups.items():
+        monthly_results = sorted(group["monthly_results"], key=lambda row: cint(row.get("bulan")))
+        try:
+            sync_annual_payroll_history_for_bulan(
+                employee=group["employee"],
+                fiscal_year=fiscal_year,
+                bulan=None,
+                monthly_results=monthly_results,
+                summary=group["summary"],
+            )
+        except Exception as e:
+            names = [row.get("salary_slip") for row in monthly_results if row.get("salary_slip")]
+            failed_slips.extend(names)
+            frappe.log_error(
+                message=f"Failed to sync Annual Payroll History for {', '.join(names)}: {e}\n{traceback.format_exc()}",
+                title="Payroll Indonesia Annual History Sync Error",
+            )
+            frappe.logger("payroll_indonesia").warning(
+                "Deferred Annual Payroll History sync failed for %s %s: %s",
+                employee_id, fiscal_year, e
+            )
+
+    return failed_slips
+
+
 def sync_annual_payroll_history_legacy(
     employee: Union[str, Dict[str, Any], Any],
     fiscal_year: str,
@@ -623,14 +804,16 @@ def sync_annual_payroll_history_for_bulan(
             )
             bulan = 1
 
-    # Validate salary slips in monthly results
+    # Validate salary slips in monthly results, fetching their status in one query
     if monthly_results:
+        docstatus_map = get_salary_slip_docstatus(
+            [row.get("salary_slip") for row in monthly_results if row.get("salary_slip")]
+        )
         valid_results = []
         for row in monthly_results:
             salary_slip = row.get("salary_slip", "")
             if salary_slip:
-                # Pass in_transaction_context=False since we're not in a savepoint yet
-                is_valid, reason = is_salary_slip_valid(salary_slip, in_transaction_context=False)
+                is_valid, reason = is_salary_slip_valid(salary_slip, docstatus_map=docstatus_map)
                 if not is_valid:
                     frappe.logger("payroll_indonesia").warning(
                         "Annual Payroll History: Skipping invalid slip: %s. Reason: %s",
@@ -667,7 +850,10 @@ def sync_annual_payroll_history_for_bulan(
 
     try:
         history = get_or_create_annual_payroll_history(
-            employee_id, fiscal_year, create_if_missing=not only_cancel
+            employee_id,
+            fiscal_year,
+            create_if_missing=not only_cancel,
+            employee_info=employee if isinstance(employee, dict) else None,
         )
 
         if not history:
@@ -701,7 +887,8 @@ def sync_annual_payroll_history_for_bulan(
         # Update monthly details
         if monthly_results:
             for row in monthly_results:
-                if upsert_monthly_detail(history, row):
+                # Slips were validated above, within this transaction
+                if upsert_monthly_detail(history, row, validate_slip=False):
                     rows_updated += 1
                     
         # Set error state
@@ -733,42 +920,11 @@ def sync_annual_payroll_history_for_bulan(
 
         # Initialize numeric fields for new documents
         if is_new_doc:
-            # Get DocType metadata to check field defaults
-            try:
-                doctype_meta = frappe.get_meta("Annual Payroll History")
-                for field in [
-                    "bruto_total",
-                    "netto_total",
-                    "pengurang_netto_total",
-                    "biaya_jabatan_total",
-                    "ptkp_annual",
-                    "pkp_annual",
-                    "pph21_annual",
-                    "koreksi_pph21",
-                ]:
-                    # Only set default if field is None (not already set)
-                    if history.get(field) is None:
-                        # Try to get default from DocType
-                        field_def = doctype_meta.get_field(field)
-                        if field_def and field_def.default is not None:
-                            history.set(field, field_def.default)
-                        else:
-                            # Fall back to 0 if no DocType default
-                            history.set(field, 0)
-            except Exception:
-                # If we can't get meta, fall back to simple initialization
-                for field in [
-                    "bruto_total",
-                    "netto_total",
-                    "pengurang_netto_total",
-                    "biaya_jabatan_total",
-                    "ptkp_annual",
-                    "pkp_annual",
-                    "pph21_annual",
-                    "koreksi_pph21",
-                ]:
-                    if history.get(field) is None:
-                        history.set(field, 0)
+            field_defaults = get_field_defaults("Annual Payroll History", SUMMARY_NUMERIC_FIELDS)
+            for field in SUMMARY_NUMERIC_FIELDS:
+                # Only set default if field is None (not already set)
+                if history.get(field) is None:
+                    history.set(field, field_defaults.get(field, 0))
 
         # Calculate totals from monthly details when no summary is provided.
         # Also ensure totals are recalculated when a salary slip is cancelled
@@ -913,7 +1069,6 @@ def normalize_month(bulan: Any) -> int:
         Normalized month as integer (1-12)
     """
     if bulan is None:
-        from datetime import datetime
         return datetime.now().month
         
     try:
@@ -925,7 +1080,6 @@ def normalize_month(bulan: Any) -> int:
         return month_int
     except (ValueError, TypeError):
         # Default to current month if invalid
-        from datetime import datetime
         return datetime.now().month
 
 
@@ -1026,7 +1180,6 @@ def sync_salary_slip_to_annual(doc: Any, method: Optional[str] = None) -> None:
                 "Cannot determine fiscal year for Salary Slip %s, using current year",
                 getattr(doc, "name", "unknown")
             )
-            from datetime import datetime
             fiscal_year = str(datetime.now().year)
 
         # Parse PPH21 info
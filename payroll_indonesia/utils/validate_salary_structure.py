@@ -24,3 +24,12 @@ def validate_salary_structure_required_components(doc, method):
             "Salary Structure tidak lengkap. Komponen berikut wajib ada:\n- "
             + "\n- ".join(missing_components)
         )
+
+
+def precompile_salary_structure_formulas(doc, method):
+    from payroll_indonesia.override.salary_slip import precompile_structure_formulas
+
+    # Parse formula sekali saat struktur disimpan, bukan saat slip pertama dihitung
+    precompile_structure_formulas(
+        [*getattr(doc, "earnings", []), *getattr(doc, "deductions", [])]
+    )